@@ -1,14 +1,30 @@
 import asyncio
-from aiogram import Bot, Dispatcher, F
-from aiogram.filters import Command, StateFilter
-from aiogram.types import Message, CallbackQuery
+import signal
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional, Tuple
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject, StateFilter
+from aiogram.types import Message, CallbackQuery, User
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from datetime import datetime
 
 import config
 import keyboards
 import database
+import metrics
+import render
+from broadcast import Broadcaster
+from dashboard import QueueDashboard
+from digest import JoinDigest
+from eta import ServiceTimeEstimator
+from fsm_storage import create_fsm_storage, create_events_isolation
+from offices import Office, offices
+from storage import DEFAULT_OFFICE
+from tasks import TaskRunner
+from text_commands import TextCommands
+from throttling import ThrottlingMiddleware
+from turns import TurnNotifier, parse_positions
 
 
 # ========== FSM ДЛЯ ИЗМЕНЕНИЯ ИМЕНИ ==========
@@ -20,22 +36,74 @@ class ChangeNameStates(StatesGroup):
 
 # ========== ИНИЦИАЛИЗАЦИЯ ==========
 bot = Bot(token=config.config.BOT_TOKEN)
-dp = Dispatcher()
-db = database.db
+dp = Dispatcher(storage=create_fsm_storage(), events_isolation=create_events_isolation())
+db = database.adb
+tasks = TaskRunner()
+broadcaster = Broadcaster(
+    bot,
+    tasks,
+    concurrency=config.config.BROADCAST_CONCURRENCY,
+    global_rate=config.config.BROADCAST_RATE,
+    chat_interval=config.config.BROADCAST_CHAT_INTERVAL
+)
+render_cache = render.RenderCache()
+
+# Частые нажатия отбрасываются до обработчиков: одно ведро на пользователя
+# для сообщений и inline-кнопок
+throttling = ThrottlingMiddleware(
+    rate=config.config.FLOOD_RATE,
+    burst=config.config.FLOOD_BURST,
+    admin_rate=config.config.FLOOD_ADMIN_RATE,
+    admin_burst=config.config.FLOOD_ADMIN_BURST,
+    is_admin=offices.is_admin,
+    max_users=config.config.FLOOD_MAX_USERS
+)
+dp.message.outer_middleware(throttling)
+dp.callback_query.outer_middleware(throttling)
+
+# Кнопки reply-клавиатур: один обработчик и поиск по словарю вместо фильтра
+# на каждую кнопку. Регистрируется раньше обработчиков состояний FSM, поэтому
+# кнопка срабатывает и посреди диалога изменения имени
+text_commands = TextCommands()
+dp.message.register(text_commands.dispatch, text_commands)
+# Сводки новых записей: у каждого кабинета своя, уходит его админам
+join_digests = {
+    office.office_id: JoinDigest(
+        bot,
+        tasks,
+        chat_ids=office.admin_ids,
+        window=config.config.ADMIN_DIGEST_WINDOW,
+        get_head=lambda office_id=office.office_id: db.get_queue_page(limit=3, office_id=office_id)
+    )
+    for office in offices
+}
+
+
+def office_name(office: Office) -> str:
+    """"Кабинет" или, если кабинетов несколько, "Кабинет «Название»" """
+    return f"Кабинет «{office.title}»" if len(offices) > 1 else "Кабинет"
+
+
+def office_title(office_id: str) -> Optional[str]:
+    """Название кабинета для заголовков; None, если кабинет один"""
+    if len(offices) < 2:
+        return None
+    office = offices.get(office_id)
+    return office.title if office else office_id
 
 
 # ========== /start ==========
 @dp.message(Command("start"))
 async def cmd_start(message: Message):
     # Сохраняем пользователя в базу
-    db.add_or_update_user(
+    await db.add_or_update_user(
         user_id=message.from_user.id,
         username=message.from_user.username,
         first_name=message.from_user.first_name,
         last_name=message.from_user.last_name
     )
 
-    is_admin = message.from_user.id == config.config.ADMIN_ID
+    is_admin = offices.is_admin(message.from_user.id)
 
     if is_admin:
         welcome_text = (
@@ -71,382 +139,381 @@ async def cmd_start(message: Message):
             parse_mode="HTML"
         )
 
-# Перезагрузка сообщения очереди
-async def refresh_queue_management(chat_id: int, message_id: int = None):
-    """Обновить сообщение с управлением очередью"""
-    queue = db.get_queue()
-    
-    if queue:
-        # Получаем первого пользователя в очереди
-        first_user = queue[0]
-        first_user_name = first_user['name']
-        
-        text = f"👤 <b>Управление очередью</b>\n\n"
-        text += f"<b>Первый в очереди:</b>\n"
-        text += f"✅ <b>{first_user_name}</b>\n"
-        text += f"🆔 ID: {first_user['user_id']}\n"
-        text += f"⏰ В очереди с: {first_user['joined_at'][11:16]}\n\n"
-        
-        if len(queue) > 1:
-            text += f"<b>Ожидают:</b> {len(queue) - 1} человек(а)\n"
-            text += f"<b>Следующий:</b> {queue[1]['name']}\n"
-        
-        keyboard = keyboards.get_queue_management_keyboard(first_user_name)
-    else:
-        text = "👤 <b>Управление очередью</b>\n\n📭 <i>Очередь пуста</i>"
-        keyboard = keyboards.get_queue_management_keyboard()
-    
-    # Если есть message_id, редактируем сообщение
-    if message_id:
-        try:
-            await bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=message_id,
-                text=text,
-                reply_markup=keyboard,
-                parse_mode="HTML"
-            )
-        except:
-            # Если не удалось редактировать (сообщение слишком старое), отправляем новое
-            await bot.send_message(
-                chat_id=chat_id,
-                text=text,
-                reply_markup=keyboard,
-                parse_mode="HTML"
-            )
-    else:
-        # Иначе отправляем новое сообщение
-        await bot.send_message(
-            chat_id=chat_id,
-            text=text,
-            reply_markup=keyboard,
-            parse_mode="HTML"
-        )
+# ========== КЭШ ОТРИСОВКИ ==========
+async def render_snapshot(template: str, render_func, office_id: str, *key):
+    """Текст шаблона для текущей версии очереди кабинета.
+
+    Если для этой версии текст уже строили, он берется из кэша без чтения
+    очереди; иначе строится по снимку очереди и сохраняется.
+    """
+    version = await db.get_queue_version(office_id)
+    cached = render_cache.get((template, office_id, version, *key))
+    if cached is not None:
+        return cached
+
+    snapshot = await db.get_queue_snapshot(office_id)
+    result = render_func(snapshot, office_id)
+    render_cache.put((template, office_id, snapshot["version"], *key), result)
+    return result
+
+
+# ========== ДАШБОРД ОЧЕРЕДИ ==========
+def build_management_view(snapshot: dict, office_id: str):
+    """Текст дашборда и inline-кнопки решения по первому в очереди"""
+    queue = snapshot["queue"]
+    first_user = queue[0] if queue else None
+    return (
+        render.render_management(queue, office_title(office_id)),
+        keyboards.get_queue_action_keyboard(first_user)
+    )
+
+
+async def management_view(chat_id: int):
+    """Дашборд админа chat_id — по очереди его кабинета"""
+    office = offices.admin_office(chat_id) or offices.default
+    return await render_snapshot("management", build_management_view, office.office_id)
+
+
+dashboard = QueueDashboard(
+    bot,
+    tasks,
+    db,
+    admin_ids=offices.admin_ids,
+    interval=config.config.DASHBOARD_INTERVAL,
+    render=management_view
+)
+
+# ========== ПРОГНОЗ ОЖИДАНИЯ ==========
+# Скорость приема у каждого кабинета своя; оценка кабинета main хранится
+# под прежним ключом service_time
+service_times = {
+    office.office_id: ServiceTimeEstimator(
+        tasks,
+        db,
+        alpha=config.config.ETA_SMOOTHING,
+        max_gap=config.config.ETA_MAX_GAP,
+        save_interval=config.config.ETA_SAVE_INTERVAL,
+        key="service_time" if office.office_id == DEFAULT_OFFICE else f"service_time:{office.office_id}"
+    )
+    for office in offices
+}
+
+
+def estimate_wait(office_id: str, position: int) -> Optional[float]:
+    estimator = service_times.get(office_id)
+    return estimator.estimate(position) if estimator else None
+
+
+# ========== УВЕДОМЛЕНИЯ О ПРИБЛИЖЕНИИ ОЧЕРЕДИ ==========
+turn_notifier = TurnNotifier(bot, tasks, db, parse_positions(config.config.TURN_NOTIFY_POSITIONS))
+
 
 # ========== КНОПКА УПРАВЛЕНИЯ ОЧЕРЕДЬЮ ==========
-@dp.message(F.text == "👤 Управление очередью")
+@text_commands.button(keyboards.BTN_MANAGE)
 async def manage_queue(message: Message):
-    if message.from_user.id != config.config.ADMIN_ID:
+    if not offices.is_admin(message.from_user.id):
         await message.answer("❌ <b>Доступ запрещен!</b>", parse_mode="HTML")
         return
     
-    queue = db.get_queue()
-    
-    if queue:
-        # Получаем первого пользователя в очереди
-        first_user = queue[0]
-        first_user_name = first_user['name']
-        
-        text = f"👤 <b>Управление очередью</b>\n\n"
-        text += f"<b>Первый в очереди:</b>\n"
-        text += f"✅ <b>{first_user_name}</b>\n"
-        text += f"⏰ В очереди с: {first_user['joined_at'][11:16]}\n\n"
-        
-        if len(queue) > 1:
-            text += f"<b>Ожидают:</b> {len(queue) - 1} человек(а)\n"
-            text += f"<b>Следующий:</b> {queue[1]['name']}\n"
-        
-        await message.answer(
-            text,
-            reply_markup=keyboards.get_queue_management_keyboard(first_user_name),
-            parse_mode="HTML"
-        )
-    else:
-        await message.answer(
-            "👤 <b>Управление очередью</b>\n\n"
-            "📭 <i>Очередь пуста</i>",
-            reply_markup=keyboards.get_queue_management_keyboard(),
-            parse_mode="HTML"
-        )
+    await message.answer(
+        "👇 <b>Принимай и отклоняй кнопками под сообщением очереди</b>",
+        reply_markup=keyboards.get_queue_management_keyboard(),
+        parse_mode="HTML"
+    )
+    # Новое сообщение-дашборд, дальше оно обновляется само
+    await dashboard.show(message.chat.id)
 
 
-# ========== КНОПКА ПРИНЯТИЯ ПОЛЬЗОВАТЕЛЯ ==========
-@dp.message(F.text.startswith("✅ Принять "))
-async def accept_user(message: Message):
-    if message.from_user.id != config.config.ADMIN_ID:
-        return
-    
-    # Извлекаем имя пользователя из текста кнопки
-    user_name = message.text.replace("✅ Принять ", "").strip()
-    
-    # Находим пользователя в очереди
-    queue = db.get_queue()
-    if not queue:
-        await message.answer("📭 <b>Очередь пуста!</b>", parse_mode="HTML")
-        return
-    
-    first_user = queue[0]
-    
-    # Проверяем, что это действительно первый пользователь
-    if first_user['name'] != user_name:
-        # Ищем пользователя по имени
-        found_user = None
-        for user in queue:
-            if user['name'] == user_name:
-                found_user = user
-                break
-        
-        if not found_user:
-            await message.answer(
-                f"❌ <b>Пользователь {user_name} не найден в очереди!</b>",
-                parse_mode="HTML"
-            )
-            return
-        
-        # Если это не первый пользователь, просто удаляем его
-        db.remove_from_queue(found_user['user_id'])
-        
-        # Уведомляем пользователя
-        try:
-            await bot.send_message(
-                found_user['user_id'],
-                f"❌ <b>Ты был удален из очереди</b>",
-                parse_mode="HTML"
-            )
-        except:
-            pass
-        
-        # Отправляем сообщение об удалении
-        response = await message.answer(
-            f"❌ <b>Пользователь {user_name} удален из очереди. Старикам тут не место</b>\n\n",
-            parse_mode="HTML"
-        )
-        
-        # Обновляем управление очередью после паузы
-        await asyncio.sleep(1)
-        await refresh_queue_management(message.chat.id, response.message_id)
-        return
-    
-    # Если это первый пользователь - принимаем его
-    user_id = first_user['user_id']
-    
-    # Уведомляем пользователя
+async def notify_user(user_id: int, text: str):
+    """Отправить уведомление пользователю (запускается через tasks.spawn)"""
     try:
-        await bot.send_message(
-            user_id,
-            f"✅ <b>Елисей готов вас принять</b>\n\n"
-            f"Ваше имя в очереди: <b>{user_name}</b>",
-            parse_mode="HTML"
-        )
+        await bot.send_message(user_id, text, parse_mode="HTML")
     except Exception as e:
         print(f"Не удалось уведомить пользователя {user_id}: {e}")
-    
-    # Удаляем пользователя из очереди
-    db.remove_from_queue(user_id)
-    
-    # Отправляем сообщение о принятии
-    response = await message.answer(
-        f"✅ <b>Пользователь {user_name} принят и удален из очереди!</b>\n\n",
-        parse_mode="HTML"
-    )
-    
-    # Обновляем управление очередью после паузы
-    await asyncio.sleep(1)
-    await refresh_queue_management(message.chat.id, response.message_id)
-
 
 
-# ========== КНОПКА ОТКЛОНЕНИЯ ПОЛЬЗОВАТЕЛЯ ==========
-@dp.message(F.text.startswith("❌ Отклонить "))
-async def reject_user(message: Message):
-    if message.from_user.id != config.config.ADMIN_ID:
+async def accept_from_queue(user_id: int, office_id: str) -> Optional[dict]:
+    """Принять первого в очереди кабинета: один вызов serve_next.
+
+    Возвращает {"served", "next"} или None, если первым уже стоит
+    кто-то другой. Уведомление уходит в фоне.
+    """
+    async with offices.lock(office_id):
+        result = await db.serve_next(user_id, office_id)
+        if result and office_id in service_times:
+            service_times[office_id].record_accept()
+    if result:
+        dashboard.touch()
+        served = result["served"]
+        turn_notifier.removed(served['user_id'], 1, office_id)
+        tasks.spawn(notify_user(
+            served['user_id'],
+            f"✅ <b>Елисей готов вас принять</b>\n\n"
+            f"Ваше имя в очереди: <b>{served['name']}</b>"
+        ))
+    return result
+
+
+async def reject_from_queue(user: dict, office_id: str) -> bool:
+    """Отклонить первого в очереди кабинета; False, если первым стоит уже не он"""
+    async with offices.lock(office_id):
+        first_user = await db.get_first_user_in_queue(office_id)
+        if not first_user or first_user['user_id'] != user['user_id']:
+            return False
+        position = await db.remove_from_queue(user['user_id'], reason="rejected")
+    if not position:
+        return False
+
+    dashboard.touch()
+    turn_notifier.removed(user['user_id'], position, office_id)
+    tasks.spawn(notify_user(
+        user['user_id'],
+        f"❌ <b>Елисей пока не готов тебя принять</b>\n\n"
+        f"Попробуй позже"
+    ))
+    return True
+
+
+# ========== ПРИНЯТИЕ И ОТКЛОНЕНИЕ (INLINE-КНОПКИ ДАШБОРДА) ==========
+@dp.callback_query(keyboards.QueueAction.filter())
+async def queue_action_callback(callback: CallbackQuery, callback_data: keyboards.QueueAction):
+    office = offices.admin_office(callback.from_user.id)
+    if office is None:
+        await callback.answer("❌ Доступ запрещен!", show_alert=True)
         return
-    
-    # Извлекаем имя пользователя из текста кнопки
-    user_name = message.text.replace("❌ Отклонить ", "").strip()
-    
-    # Находим пользователя в очереди
-    queue = db.get_queue()
-    if not queue:
-        await message.answer("📭 <b>Очередь пуста</b>", parse_mode="HTML")
+
+    # Кнопки относятся к тому, кто был первым. Запись в хвост или смена статуса
+    # их не портят; если первый сменился, serve_next и reject_from_queue
+    # ничего не сделают и дашборд перерисуется
+
+    if callback_data.action == "accept":
+        result = await accept_from_queue(callback_data.user_id, office.office_id)
+        if result:
+            text = f"✅ {result['served']['name']} принят"
+            if result["next"]:
+                text += f". Следующий: {result['next']['name']}"
+            await callback.answer(text)
+            return
+    else:
+        user = await db.get_user_info(callback_data.user_id)
+        if user and await reject_from_queue(user, office.office_id):
+            await callback.answer(f"❌ {user['name']} отклонен")
+            return
+
+    dashboard.touch()
+    await callback.answer("ℹ️ Очередь уже изменилась")
+
+
+# ========== СТАРЫЕ КНОПКИ "ПРИНЯТЬ/ОТКЛОНИТЬ ИМЯ" ==========
+# Клавиатуры с именами могли остаться у админа после обновления бота.
+# По имени решаем только про первого в очереди: имена не уникальны.
+async def legacy_decision(message: Message, prefix: str, accepted: bool):
+    office = offices.admin_office(message.from_user.id)
+    if office is None:
         return
-    
-    # Ищем пользователя по имени
-    found_user = None
-    user_position = 0
-    
-    for i, user in enumerate(queue):
-        if user['name'] == user_name:
-            found_user = user
-            user_position = i + 1
-            break
-    
-    if not found_user:
+
+    user_name = message.text.replace(prefix, "").strip()
+    first_user = await db.get_first_user_in_queue(office.office_id)
+    if not first_user:
         await message.answer(
-            f"❌ <b>Пользователь {user_name} не найден в очереди!</b>",
+            "📭 <b>Очередь пуста!</b>",
+            reply_markup=keyboards.get_queue_management_keyboard(),
             parse_mode="HTML"
         )
         return
-    
-    user_id = found_user['user_id']
-    
-    # Удаляем пользователя из очереди
-    db.remove_from_queue(user_id)
-    
-    # Уведомляем пользователя
-    try:
-        await bot.send_message(
-            user_id,
-            f"❌ <b>Елисей пока не готов тебя принять</b>\n\n"
-            f"Попробуй позже",
-            parse_mode="HTML"
-        )
-    except Exception as e:
-        print(f"Не удалось уведомить пользователя {user_id}: {e}")
-    
-    await message.answer(
-        f"❌ <b>Пользователь {user_name} отклонен и удален из очереди:</b>\n\n",
-        parse_mode="HTML"
-    )
-    
-    # Показываем следующего пользователя, если есть
-    queue = db.get_queue()
-    if queue:
-        next_user = queue[0]
-        await asyncio.sleep(1)
+
+    done = False
+    if first_user['name'] == user_name:
+        if accepted:
+            done = await accept_from_queue(first_user['user_id'], office.office_id) is not None
+        else:
+            done = await reject_from_queue(first_user, office.office_id)
+
+    if not done:
         await message.answer(
-            f"<b>Следующий в очереди: {next_user['name']}</b>\n\n"
-            f"В очереди с: {next_user['joined_at'][11:16]}\n\n",
+            "⚠️ <b>Кнопка устарела.</b> Используй кнопки под сообщением очереди.",
+            reply_markup=keyboards.get_queue_management_keyboard(),
             parse_mode="HTML"
         )
+        return
+
+    if accepted:
+        text = f"✅ <b>Пользователь {user_name} принят и удален из очереди!</b>"
+    else:
+        text = f"❌ <b>Пользователь {user_name} отклонен и удален из очереди</b>"
+    await message.answer(text, reply_markup=keyboards.get_queue_management_keyboard(), parse_mode="HTML")
+
+
+@text_commands.prefix(keyboards.ACCEPT_PREFIX)
+async def accept_user(message: Message):
+    await legacy_decision(message, keyboards.ACCEPT_PREFIX, accepted=True)
+
+
+@text_commands.prefix(keyboards.REJECT_PREFIX)
+async def reject_user(message: Message):
+    await legacy_decision(message, keyboards.REJECT_PREFIX, accepted=False)
 
 
 # ========== КНОПКА СТАТИСТИКА ОЧЕРЕДИ ==========
-@dp.message(F.text == "📊 Статистика очереди")
+@text_commands.button(keyboards.BTN_STATS)
 async def queue_statistics(message: Message):
-    if message.from_user.id != config.config.ADMIN_ID:
+    office = offices.admin_office(message.from_user.id)
+    if office is None:
         return
     
-    queue = db.get_queue()
-    
-    text = "<b>📊 Статистика очереди</b>\n\n"
-    
-    text += f"<b>Всего в очереди:</b> {len(queue)} человек(а)\n"
-    
-    if queue:
-        now = datetime.now()
-        
-        # Среднее время ожидания
-        total_waiting = 0
-        
-        for user in queue:
-            joined_at = datetime.fromisoformat(user['joined_at'])
-            waiting_time = (now - joined_at).seconds // 60  # в минутах
-            total_waiting += waiting_time
-        
-        if len(queue) > 0:
-            avg_waiting = total_waiting // len(queue)
-            text += f"<b>Среднее время ожидания:</b> {avg_waiting} мин.\n"
-        
-        # Самый долго ждущий (первый в очереди)
-        first_user = queue[0]
-        first_joined = datetime.fromisoformat(first_user['joined_at'])
-        longest_wait = (now - first_joined).seconds // 60
-        text += f"<b>Дольше всех ждет:</b> {first_user['name']} ({longest_wait} мин.)\n"
-        
-        # Если есть второй в очереди
-        if len(queue) > 1:
-            second_user = queue[1]
-            second_joined = datetime.fromisoformat(second_user['joined_at'])
-            second_wait = (now - second_joined).seconds // 60
-            text += f"<b>Следующий:</b> {second_user['name']} ({second_wait} мин.)\n"
-        
-        # Общее время ожидания всех
-        text += f"<b>Общее время ожидания:</b> {total_waiting} мин.\n"
-    
-    # Отправляем статистику в отдельном сообщении
-    await message.answer(text, parse_mode="HTML")
+    stats = await db.get_queue_stats(office.office_id)
+    await message.answer(render.render_queue_stats(stats), parse_mode="HTML")
 
 
-# ========== УВЕДОМЛЕНИЕ АДМИНУ О НОВОМ ПОЛЬЗОВАТЕЛЕ ==========
-@dp.message(F.text == "📝 Встать в очередь")
-async def join_queue_start(message: Message):
-    status = db.get_office_status()
+# ========== ОТЧЕТ ПО ЖУРНАЛУ ОЧЕРЕДИ ==========
+def parse_report_range(args: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Период отчета: без аргументов — сегодня, N — последние N дней,
+    ГГГГ-ММ-ДД [ГГГГ-ММ-ДД] — даты включительно. None — если не разобрать"""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    parts = (args or "").split()
+    try:
+        if not parts:
+            since, until = today, today + timedelta(days=1)
+        elif len(parts) == 1 and parts[0].isdigit():
+            since, until = today - timedelta(days=int(parts[0]) - 1), today + timedelta(days=1)
+        elif len(parts) <= 2:
+            since = datetime.strptime(parts[0], "%Y-%m-%d")
+            until = datetime.strptime(parts[-1], "%Y-%m-%d") + timedelta(days=1)
+        else:
+            return None
+    except (ValueError, OverflowError):
+        return None
+    if until <= since:
+        return None
+    return int(since.timestamp()), int(until.timestamp())
+
+
+@dp.message(Command("report"))
+async def cmd_report(message: Message, command: CommandObject):
+    office = offices.admin_office(message.from_user.id)
+    if office is None:
+        return
 
-    if message.from_user.id == config.config.ADMIN_ID:
+    period = parse_report_range(command.args)
+    if period is None:
         await message.answer(
-            "👑 <b>Босс ВТиПО не может вставать в очередь.</b>",
+            "❌ <b>Не понял период.</b>\n\n"
+            "/report — за сегодня\n"
+            "/report 7 — за последние 7 дней\n"
+            "/report 2024-09-01 2024-09-30 — за даты включительно",
             parse_mode="HTML"
         )
         return
 
-    if status["status"] == "closed":
+    report = await db.get_queue_report(*period, office_id=office.office_id)
+    await message.answer(render.render_queue_report(report), parse_mode="HTML")
+
+
+# ========== ВСТАТЬ В ОЧЕРЕДЬ ==========
+@text_commands.button(keyboards.BTN_JOIN)
+async def join_queue_start(message: Message):
+    if offices.is_admin(message.from_user.id):
         await message.answer(
-            f"❌ <b>Кабинет закрыт, отъебитес</b>\n{status.get('message', '')}",
+            "👑 <b>Босс ВТиПО не может вставать в очередь.</b>",
             parse_mode="HTML"
         )
         return
 
-    position = db.get_user_position(message.from_user.id)
+    position = await db.get_user_position(message.from_user.id)
     if position:
         await message.answer(
             f"⚠️ <b>Ты уже в очереди.</b> Твой номер: <b>{position}</b>",
             parse_mode="HTML"
         )
         return
-    
+
+    # Кабинетов несколько — сначала спрашиваем, в какой
+    if len(offices) > 1:
+        await message.answer(
+            "🚪 <b>В какой кабинет встать в очередь?</b>",
+            reply_markup=keyboards.get_office_choice_keyboard(offices),
+            parse_mode="HTML"
+        )
+        return
+
+    await join_queue(message.from_user, offices.default,
+                     lambda text: message.answer(text, parse_mode="HTML"))
+
+
+@dp.callback_query(keyboards.JoinOffice.filter())
+async def join_office_callback(callback: CallbackQuery, callback_data: keyboards.JoinOffice):
+    office = offices.get(callback_data.office_id)
+    if office is None or offices.is_admin(callback.from_user.id):
+        await callback.answer("⚠️ Кнопка устарела", show_alert=True)
+        return
+
+    async def answer(text: str):
+        try:
+            await callback.message.edit_text(text, parse_mode="HTML")
+        except TelegramBadRequest:
+            await callback.message.answer(text, parse_mode="HTML")
+
+    await join_queue(callback.from_user, office, answer)
+    await callback.answer()
+
+
+async def join_queue(user: User, office: Office, answer: Callable[[str], Awaitable]):
+    """Поставить пользователя в очередь кабинета; ответ уходит через answer"""
     # Получаем имя пользователя из аккаунта Telegram
-    user_name = message.from_user.first_name
-    if message.from_user.last_name:
-        user_name += f" {message.from_user.last_name}"
+    user_name = user.first_name
+    if user.last_name:
+        user_name += f" {user.last_name}"
 
      # Если нет имени, используем username
     if not user_name or user_name.strip() == "":
-        if message.from_user.username:
-            user_name = f"@{message.from_user.username}"
+        if user.username:
+            user_name = f"@{user.username}"
         else:
-            user_name = f"User_{message.from_user.id}"
+            user_name = f"User_{user.id}"
 
-    # Добавляем в очередь
-    result = db.add_to_queue(message.from_user.id, user_name)
+    # Проверка статуса и запись идут под блокировкой кабинета:
+    # закрытие кабинета не проскочит между ними
+    async with offices.lock(office.office_id):
+        status = await db.get_office_status(office.office_id)
+        position = None
+        if status["status"] != "closed":
+            # add_to_queue уже возвращает позицию
+            position = await db.add_to_queue(user.id, user_name, office.office_id)
 
-    if result == -1:
-        await message.answer("⚠️ <b>Ты уже в очереди</b>", parse_mode="HTML")
+    if status["status"] == "closed":
+        await answer(
+            f"❌ <b>{office_name(office)} закрыт, отъебитес</b>\n{status.get('message', '')}"
+        )
         return
 
-    position = db.get_user_position(message.from_user.id)
+    if position == -1:
+        await answer("⚠️ <b>Ты уже в очереди</b>")
+        return
 
     if position:
-        await message.answer(
-            f"✅ <b>Ты добавлен в очередь</b>\n\n"
+        dashboard.touch()
+        text = "✅ <b>Ты добавлен в очередь</b>\n\n"
+        if len(offices) > 1:
+            text += f"• Кабинет: <b>{office.title}</b>\n"
+        text += (
             f"• Твой номер: <b>{position}</b>\n"
-            f"• Людей перед вами: <b>{position - 1}</b>",
-            parse_mode="HTML"
+            f"• Людей перед вами: <b>{position - 1}</b>"
         )
+        eta = estimate_wait(office.office_id, position)
+        if eta is not None:
+            text += f"\n• Примерное ожидание: <b>{render.format_eta(eta)}</b>"
+        await answer(text)
         
-        # УВЕДОМЛЕНИЕ АДМИНУ О НОВОМ ПОЛЬЗОВАТЕЛЕ
-        if config.config.ADMIN_ID:
-            try:
-                queue = db.get_queue()
-                total_in_queue = len(queue)
-                
-                # Получаем список первых 3 в очереди для информации
-                first_three = queue[:3]
-                queue_info = ""
-                for i, user in enumerate(first_three, 1):
-                    queue_info += f"{i}. {user['name']}\n"
-                
-                if total_in_queue > 3:
-                    queue_info += f"... и еще {total_in_queue - 3}\n"
-                
-                await bot.send_message(
-                    config.config.ADMIN_ID,
-                    f"👤 <b>Новый пользователь {user_name} в очереди, милорд!</b>\n\n"
-                    f"• Его позиция: <b>{position}</b>\n"
-                    f"• Всего в очереди: <b>{total_in_queue}</b>\n\n"
-                    f"<b>Текущая очередь:</b>\n{queue_info}\n",
-                    parse_mode="HTML"
-                )
-            except Exception as e:
-                print(f"Не удалось отправить уведомление админу: {e}")
+        # УВЕДОМЛЕНИЕ АДМИНУ О НОВОМ ПОЛЬЗОВАТЕЛЕ (сводкой за ADMIN_DIGEST_WINDOW)
+        await join_digests[office.office_id].add(user_name, position)
     else:
-        await message.answer("❌ <b>Произошла ошибка при добавлении в очередь</b>", parse_mode="HTML")
+        await answer("❌ <b>Произошла ошибка при добавлении в очередь</b>")
 
 
 # ========== КНОПКА НАЗАД В МЕНЮ ==========
-@dp.message(F.text == "◀️ Назад в меню")
+@text_commands.button(keyboards.BTN_BACK)
 async def back_to_menu(message: Message):
-    if message.from_user.id == config.config.ADMIN_ID:
+    if offices.is_admin(message.from_user.id):
         await message.answer(
             "🏠 <b>Главное меню админа</b>",
             reply_markup=keyboards.get_admin_keyboard(),
@@ -463,7 +530,7 @@ async def back_to_menu(message: Message):
 @dp.message(Command("change_name"))
 async def cmd_change_name(message: Message, state: FSMContext):
     """Команда для изменения имени пользователя (только для админа)"""
-    if message.from_user.id != config.config.ADMIN_ID:
+    if not offices.is_admin(message.from_user.id):
         await message.answer("❌ <b>Доступ запрещен!</b>", parse_mode="HTML")
         return
     
@@ -477,10 +544,10 @@ async def cmd_change_name(message: Message, state: FSMContext):
     await state.set_state(ChangeNameStates.waiting_for_user_id)
 
 # ========== КНОПКА ИЗМЕНЕНИЯ ИМЕНИ ==========
-@dp.message(F.text == "✏️ Изменить имя")
+@text_commands.button(keyboards.BTN_CHANGE_NAME)
 async def change_name_button(message: Message, state: FSMContext):
     """Кнопка для изменения имени пользователя (только для админа)"""
-    if message.from_user.id != config.config.ADMIN_ID:
+    if not offices.is_admin(message.from_user.id):
         await message.answer("❌ <b>Доступ запрещен!</b>", parse_mode="HTML")
         return
     
@@ -494,11 +561,11 @@ async def change_name_button(message: Message, state: FSMContext):
     await state.set_state(ChangeNameStates.waiting_for_user_id)    
 
 # ========== ОТМЕНА ДЕЙСТВИЯ ==========
-@dp.message(F.text == "❌ Отмена")
+@text_commands.button(keyboards.BTN_CANCEL)
 async def cancel_action(message: Message, state: FSMContext):
     """Отмена любого действия"""
     await state.clear()
-    if message.from_user.id == config.config.ADMIN_ID:
+    if offices.is_admin(message.from_user.id):
         await message.answer(
             "❌ <b>Действие отменено</b>",
             reply_markup=keyboards.get_admin_keyboard(),
@@ -519,7 +586,7 @@ async def process_user_id(message: Message, state: FSMContext):
     # Если ввели числовой ID
     if user_input.isdigit():
         user_id = int(user_input)
-        user_info = db.get_user_info(user_id)
+        user_info = await db.get_user_info(user_id)
         
         if not user_info:
             await message.answer(
@@ -543,7 +610,8 @@ async def process_user_id(message: Message, state: FSMContext):
     
     # Если ввели текст (поиск по имени)
     else:
-        users = db.search_user_by_name(user_input)
+        office = offices.admin_office(message.from_user.id) or offices.default
+        users = await db.search_user_by_name(user_input, office.office_id)
         
         if not users:
             await message.answer(
@@ -569,12 +637,13 @@ async def process_user_id(message: Message, state: FSMContext):
             # Показываем список найденных пользователей
             text = f"🔍 <b>Найдено пользователей ({len(users)}):</b>\n\n"
             for i, user in enumerate(users, 1):
-                position = db.get_user_position(user['user_id'])
+                position = await db.get_user_position(user['user_id'])
                 text += f"{i}. <b>{user['name']}</b> (ID: {user['user_id']}, позиция: {position})\n"
             
             text += "\n<b>Введи ID нужного пользователя:</b>"
             
-            await state.update_data(search_results=users)
+            # В состоянии храним только ID, а не весь список найденных записей
+            await state.update_data(search_results=[user['user_id'] for user in users])
             await message.answer(text, parse_mode="HTML")
 
 
@@ -597,13 +666,13 @@ async def process_new_name(message: Message, state: FSMContext):
     current_name = data.get('current_name')
     
     # Меняем имя в базе данных
-    success = db.update_user_display_name(user_id, new_name)
+    success = await db.update_user_display_name(user_id, new_name)
     
     if success:
         # Получаем обновленную позицию
-        position = db.get_user_position(user_id)
+        position = await db.get_user_position(user_id)
         
-        response = await message.answer(
+        await message.answer(
             f"✅ <b>Имя успешно изменено!</b>\n\n"
             f"👤 Пользователь ID: {user_id}\n"
             f"📝 Было: <b>{current_name}</b>\n"
@@ -612,23 +681,16 @@ async def process_new_name(message: Message, state: FSMContext):
         )
         
         # Уведомляем пользователя, если это не админ
-        if user_id != config.config.ADMIN_ID:
-            try:
-                await bot.send_message(
-                    user_id,
-                    f"✏️ <b>Администратор изменил твое имя:</b>\n\n"
-                    f"📝 Было: <b>{current_name}</b>\n"
-                    f"📝 Теперь тебя зовут: <b>{new_name}</b>\n",
-                    parse_mode="HTML"
-                )
-            except:
-                pass
+        if not offices.is_admin(user_id):
+            tasks.spawn(notify_user(
+                user_id,
+                f"✏️ <b>Администратор изменил твое имя:</b>\n\n"
+                f"📝 Было: <b>{current_name}</b>\n"
+                f"📝 Теперь тебя зовут: <b>{new_name}</b>\n"
+            ))
         
-        # Если пользователь был первым в очереди, обновляем управление очередью
-        queue = db.get_queue()
-        if queue and queue[0]['user_id'] == user_id:
-            await asyncio.sleep(1)
-            await refresh_queue_management(message.chat.id, response.message_id)
+        # Имя могло показываться на дашборде
+        dashboard.touch()
     else:
         await message.answer(
             "❌ <b>Не удалось изменить имя.</b>\n"
@@ -645,209 +707,331 @@ async def process_new_name(message: Message, state: FSMContext):
     )
 
 # ========== ПОСМОТРЕТЬ ОЧЕРЕДЬ ==========
-@dp.message(F.text == "👀 Посмотреть очередь")
-async def view_queue(message: Message):
-    queue = db.get_queue()
-    status = db.get_office_status()
-
-    if not queue:
-        text = "📭 <b>Очередь пуста</b>\n\n"
+# Не больше 50 имен за раз; страницу, которая не помещается в одно сообщение,
+# fit_queue_page укорачивает
+QUEUE_PAGE_SIZE = max(1, min(config.config.QUEUE_PAGE_SIZE, 50))
+
+
+async def build_queue_page(viewer_id: int, office_id: str, direction: str = "first", seq: int = 0):
+    """Текст и клавиатура страницы очереди кабинета (кэшируются по версии очереди)"""
+    version = await db.get_queue_version(office_id)
+    key = ("queue_page", office_id, version, direction, seq, viewer_id)
+    cached = render_cache.get(key)
+    if cached is not None:
+        return cached
+
+    if direction == "next":
+        page = await db.get_queue_page(after_seq=seq, limit=QUEUE_PAGE_SIZE, office_id=office_id)
+    elif direction == "prev":
+        page = await db.get_queue_page(before_seq=seq, limit=QUEUE_PAGE_SIZE, office_id=office_id)
+    elif direction == "me":
+        page = await db.get_queue_page(start_user_id=viewer_id, limit=QUEUE_PAGE_SIZE, office_id=office_id)
     else:
-        text = "📋 <b>Текущая очередь:</b>\n\n"
-        for i, user in enumerate(queue, start=1):
-            text += f"{i}. {user['name']}\n"
-        text += f"\n<b>Всего в очереди:</b> {len(queue)} человек(а)\n"
-
-    status_map = {
-        "open": "✅ Открыт",
-        "closed": "❌ Закрыт"
-    }
-
-    text += f"\n<b>Статус кабинета:</b> {status_map.get(status['status'], status['status'])}"
-
-    if status.get("message"):
-        text += f"\n{status['message']}"
-
-    await message.answer(text, parse_mode="HTML")
-
-
-# ========== ВСТАТЬ В ОЧЕРЕДЬ ==========
-@dp.message(F.text == "📝 Встать в очередь")
-async def join_queue_start(message: Message, state: FSMContext):
-    status = db.get_office_status()
-
-    if message.from_user.id == config.config.ADMIN_ID:
-        await message.answer(
-            "👑 <b>Босс ВТиПО не может вставать в очередь.</b>",
-            parse_mode="HTML"
+        page = await db.get_queue_page(limit=QUEUE_PAGE_SIZE, office_id=office_id)
+    status = await db.get_office_status(office_id)
+    text, page = render.fit_queue_page(page, status, viewer_id, office_title(office_id))
+
+    # Кнопка "Где я?" нужна, только если зритель в этой очереди, но не на этой странице
+    on_page = any(entry["user_id"] == viewer_id for entry in page["entries"])
+    show_my_position = not on_page and await db.get_user_office(viewer_id) == office_id
+
+    result = (
+        text,
+        keyboards.get_queue_page_keyboard(
+            page, office_id, show_my_position,
+            [office for office in offices if office.office_id != office_id]
         )
-        return
+    )
+    render_cache.put(key, result)
+    return result
 
-    if status["status"] == "closed":
-        await message.answer(
-            f"❌ <b>Кабинет закрыт, отъебитес</b>\n{status.get('message', '')}",
-            parse_mode="HTML"
-        )
-        return
 
-    position = db.get_user_position(message.from_user.id)
-    if position:
-        await message.answer(
-            f"⚠️ <b>Ты уже в очереди!</b> Твой номер: <b>{position}</b>",
-            parse_mode="HTML"
-        )
-        return
-    
-    # Получаем имя пользователя из аккаунта Telegram
-    user_name = message.from_user.first_name
-    if message.from_user.last_name:
-        user_name += f" {message.from_user.last_name}"
+async def viewer_office(user_id: int) -> str:
+    """Чью очередь показать: кабинет админа, очередь, где стоит пользователь, или кабинет по умолчанию"""
+    office = offices.admin_office(user_id)
+    if office is not None:
+        return office.office_id
+    return await db.get_user_office(user_id) or offices.default.office_id
 
-     # Если нет имени, используем username
-    if not user_name or user_name.strip() == "":
-        if message.from_user.username:
-            user_name = f"@{message.from_user.username}"
-        else:
-            user_name = f"User_{message.from_user.id}"
 
-    # Добавляем в очередь
-    result = db.add_to_queue(message.from_user.id, user_name)
+@text_commands.button(keyboards.BTN_VIEW_QUEUE)
+async def view_queue(message: Message):
+    office_id = await viewer_office(message.from_user.id)
+    text, keyboard = await build_queue_page(message.from_user.id, office_id)
+    await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
 
-    if result == -1:
-        await message.answer("⚠️ <b>Ты уже в очереди!</b>", parse_mode="HTML")
+
+@dp.callback_query(keyboards.QueuePage.filter())
+async def queue_page_callback(callback: CallbackQuery, callback_data: keyboards.QueuePage):
+    # office приходит от клиента: неизвестные кабинеты не запрашиваем
+    if offices.get(callback_data.office) is None:
+        await callback.answer("⚠️ Кнопка устарела", show_alert=True)
         return
 
-    queue = db.get_queue()
-    position = db.get_user_position(message.from_user.id)
+    text, keyboard = await build_queue_page(
+        callback.from_user.id, callback_data.office, callback_data.direction, callback_data.seq
+    )
+    try:
+        await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
+    except TelegramBadRequest:
+        # Страница не изменилась или сообщение слишком старое
+        pass
+    await callback.answer()
 
-    if position:
-        await message.answer(
-            f"✅ <b>Ты добавлен в очередь!</b>\n\n"
-            f"• Твой номер: <b>{position}</b>\n"
-            f"• Твое имя: <b>{user_name}</b>\n"
-            f"• Людей перед тобой: <b>{position - 1}</b>",
-            parse_mode="HTML"
-        )
-    else:
-        await message.answer("❌ <b>Произошла ошибка при добавлении в очередь</b>", parse_mode="HTML")
 
 # ========== МОЙ НОМЕР ==========
-@dp.message(F.text == "🔍 Мой номер в очереди")
+@text_commands.button(keyboards.BTN_MY_POSITION)
 async def my_position(message: Message):
-    position = db.get_user_position(message.from_user.id)
+    office_id = await db.get_user_office(message.from_user.id)
+    position = await db.get_user_position(message.from_user.id) if office_id else None
 
     if position:
-        queue = db.get_queue()
-        await message.answer(
-            f"🔢 <b>Твой номер номер:</b> {position}\n"
-            f"👥 <b>Перед тобой:</b> {position - 1}\n"
-            f"📊 <b>Всего в очереди:</b> {len(queue)}",
-            parse_mode="HTML"
-        )
+        version = await db.get_queue_version(office_id)
+        eta = estimate_wait(office_id, position)
+        # Оценка меняется только при принятии, то есть вместе с версией очереди
+        key = ("my_position", office_id, version, position, eta)
+        text = render_cache.get(key)
+        if text is None:
+            total_in_queue = await db.get_queue_length(office_id)
+            text = render.render_my_position(position, total_in_queue, eta)
+            render_cache.put(key, text)
+        await message.answer(text, parse_mode="HTML")
     else:
         await message.answer("ℹ️ <b>Ты не в очереди</b>", parse_mode="HTML")
 
 
 # ========== ВЫЙТИ ИЗ ОЧЕРЕДИ ==========
-@dp.message(F.text == "🚪 Выйти из очереди")
+@text_commands.button(keyboards.BTN_LEAVE)
 async def leave_queue(message: Message):
-    if db.remove_from_queue(message.from_user.id):
+    office_id = await db.get_user_office(message.from_user.id)
+    position = await db.remove_from_queue(message.from_user.id)
+    if position:
+        dashboard.touch()
+        turn_notifier.removed(message.from_user.id, position, office_id)
         await message.answer("✅ <b>Ты вышел из очереди</b>", parse_mode="HTML")
     else:
         await message.answer("ℹ️ <b>Ты не был в очереди</b>", parse_mode="HTML")
 
+# ========== ПОДПИСКА НА УВЕДОМЛЕНИЯ ==========
+@text_commands.button(keyboards.BTN_NOTIFICATIONS)
+async def toggle_turn_notifications(message: Message):
+    if not turn_notifier.positions:
+        await message.answer("ℹ️ <b>Уведомления о приближении очереди отключены</b>", parse_mode="HTML")
+        return
+
+    enabled = not await db.get_turn_notifications(message.from_user.id)
+    if not await db.set_turn_notifications(message.from_user.id, enabled):
+        await message.answer("❌ <b>Сначала нажми /start</b>", parse_mode="HTML")
+        return
+
+    if enabled:
+        positions = ", ".join(str(position) for position in reversed(turn_notifier.positions))
+        await message.answer(
+            f"🔔 <b>Уведомления включены</b>\n\n"
+            f"Напишу, когда твой номер в очереди станет: {positions}.",
+            parse_mode="HTML"
+        )
+    else:
+        await message.answer("🔕 <b>Уведомления выключены</b>", parse_mode="HTML")
+
+
 # ========== СТАТУС КАБИНЕТА ==========
-@dp.message(F.text == "⏰ Статус кабинета")
+@text_commands.button(keyboards.BTN_STATUS)
 async def office_status(message: Message):
-    status = db.get_office_status()
-
     status_texts = {
         "open": "✅ <b>ОТКРЫТ</b>",
         "closed": "❌ <b>ЗАКРЫТ</b>"
     }
 
-    text = f"🚪 <b>Статус кабинета:</b> {status_texts.get(status['status'], status['status'])}\n"
+    parts = []
+    for office in offices:
+        status = await db.get_office_status(office.office_id)
+        label = "Статус кабинета" if len(offices) == 1 else office.title
+        text = f"🚪 <b>{label}:</b> {status_texts.get(status['status'], status['status'])}\n"
 
-    if status.get("message"):
-        text += f"\n<b>Комментарий:</b> {status['message']}"
+        if status.get("message"):
+            text += f"\n<b>Комментарий:</b> {status['message']}"
 
-    # Форматируем дату
-    updated_at = status['updated_at']
-    if 'T' in updated_at:
-        updated_at = updated_at.replace('T', ' ')[:16]
-    
-    text += f"\n\n<b>Обновлено:</b> {updated_at}"
+        text += f"\n\n<b>Обновлено:</b> {render.format_time(status['updated_at'], '%Y-%m-%d %H:%M')}"
+        parts.append(text)
 
-    await message.answer(text, parse_mode="HTML")
+    await message.answer("\n\n".join(parts), parse_mode="HTML")
 
 
 # ========== АДМИН ПАНЕЛЬ ==========
-@dp.message(F.text == "✅ Открыть кабинет")
+@text_commands.button(keyboards.BTN_OPEN)
 async def admin_open(message: Message):
-    if message.from_user.id != config.config.ADMIN_ID:
+    office = offices.admin_office(message.from_user.id)
+    if office is None:
         return
     
-    db.set_office_status("open", "Кабинет открыт")
-    await notify_all("ℹ️ <b>Кабинет открыт</b> Можно вставать в очередь.")
-    await message.answer("✅ <b>Кабинет открыт</b>", parse_mode="HTML")
+    async with offices.lock(office.office_id):
+        await db.set_office_status("open", f"{office_name(office)} открыт", office.office_id)
+    dashboard.touch()
+    await message.answer(f"✅ <b>{office_name(office)} открыт</b>", parse_mode="HTML")
+    await notify_all(f"ℹ️ <b>{office_name(office)} открыт</b> Можно вставать в очередь.", message.chat.id)
 
 
-@dp.message(F.text == "❌ Закрыть кабинет")
+@text_commands.button(keyboards.BTN_CLOSE)
 async def admin_close(message: Message):
-    if message.from_user.id != config.config.ADMIN_ID:
+    office = offices.admin_office(message.from_user.id)
+    if office is None:
         return
     
-    db.set_office_status("closed", "Кабинет закрыт")
-    await notify_all("⚠️ <b>Кабинет закрыт</b>")
-    await message.answer("❌ <b>Кабинет закрыт</b>", parse_mode="HTML")
+    async with offices.lock(office.office_id):
+        await db.set_office_status("closed", f"{office_name(office)} закрыт", office.office_id)
+    dashboard.touch()
+    await message.answer(f"❌ <b>{office_name(office)} закрыт</b>", parse_mode="HTML")
+    await notify_all(f"⚠️ <b>{office_name(office)} закрыт</b>", message.chat.id)
 
 
-@dp.message(F.text == "🗑️ Очистить очередь")
+@text_commands.button(keyboards.BTN_CLEAR)
 async def admin_clear(message: Message):
-    if message.from_user.id != config.config.ADMIN_ID:
+    office = offices.admin_office(message.from_user.id)
+    if office is None:
         return
     
-    db.clear_queue()
-    await notify_all("🗑️ <b>Очередь очищена администратором</b>")
-    await message.answer("🗑️ <b>Очередь очищена</b>", parse_mode="HTML")
+    async with offices.lock(office.office_id):
+        queue = await db.get_queue(office.office_id)
+        await db.clear_queue(office.office_id)
+    dashboard.touch()
+    turn_notifier.cleared(entry["user_id"] for entry in queue)
+    title = "Очередь очищена" if len(offices) == 1 else f"Очередь в кабинет «{office.title}» очищена"
+    await message.answer(f"🗑️ <b>{title}</b>", parse_mode="HTML")
+    await notify_all(f"🗑️ <b>{title} администратором</b>", message.chat.id)
 
 
 # ========== УВЕДОМЛЕНИЯ ==========
-async def notify_all(text: str):
-    """Отправить уведомление всем пользователям бота"""
-    user_ids = db.get_all_user_ids()
-    success_count = 0
-    fail_count = 0
-    
-    for user_id in user_ids:
-        try:
-            await bot.send_message(user_id, text, parse_mode="HTML")
-            success_count += 1
-        except Exception as e:
-            # Логируем ошибки, если нужно
-            fail_count += 1
-            print(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
-    
-    # Для админа можно добавить статистику отправки
-    if config.config.ADMIN_ID:
-        try:
-            await bot.send_message(
-                config.config.ADMIN_ID,
-                f"    Уведомление отправлено:\n"
-                f"✅ Успешно: {success_count}\n"
-                f"❌ Не удалось: {fail_count}",
-                parse_mode="HTML"
+async def notify_all(text: str, report_chat_id: Optional[int] = None):
+    """Запустить фоновую рассылку уведомления всем пользователям бота.
+
+    Прогресс и итоговая статистика отправки приходят админу report_chat_id.
+    """
+    user_ids = await db.get_all_user_ids()
+    broadcaster.start(user_ids, text, report_chat_id=report_chat_id)
+
+
+# ========== МЕТРИКИ ==========
+async def collect_queue_metrics():
+    """Длина очереди и статус каждого кабинета — на момент запроса метрик"""
+    metrics.office_status.clear()
+    for office in offices:
+        metrics.queue_length.set(await db.get_queue_length(office.office_id), office.office_id)
+        status = await db.get_office_status(office.office_id)
+        metrics.office_status.set(1, office.office_id, status["status"])
+
+
+# Без METRICS_PORT ничего не подключается: обработчики, запросы к Telegram
+# и хранилище работают без замеров
+metrics_server = None
+if config.config.METRICS_PORT:
+    metrics.install(dp, bot, db)
+    metrics.registry.on_collect(collect_queue_metrics)
+    metrics_server = metrics.MetricsServer(config.config.METRICS_HOST, config.config.METRICS_PORT)
+
+
+# ========== ЗАПУСК ==========
+@dp.startup()
+async def on_startup():
+    db.start_flushing(config.config.USER_FLUSH_INTERVAL)
+    if metrics_server:
+        await metrics_server.start()
+    await dashboard.start()
+    for estimator in service_times.values():
+        await estimator.start()
+
+    if config.config.RUN_MODE == "webhook":
+        # Если WEBHOOK_URL не задан, вебхук уже зарегистрирован (например, другим воркером)
+        if config.config.WEBHOOK_URL:
+            await bot.set_webhook(
+                config.config.WEBHOOK_URL.rstrip("/") + config.config.WEBHOOK_PATH,
+                secret_token=config.config.WEBHOOK_SECRET or None,
+                allowed_updates=dp.resolve_used_update_types()
             )
-        except:
+    else:
+        # Long polling не работает, пока у бота установлен вебхук
+        await bot.delete_webhook()
+
+
+@dp.shutdown()
+async def on_shutdown():
+    # Отправляем накопленную сводку, сохраняем оценку времени приема и останавливаем фоновые задачи
+    # (рассылки, дашборд), пока сессия бота еще открыта
+    for digest in join_digests.values():
+        await digest.close()
+    for estimator in service_times.values():
+        await estimator.close()
+    await tasks.close()
+    if metrics_server:
+        await metrics_server.close()
+
+
+def check_webhook_workers():
+    """Несколько процессов за балансировщиком могут делить только Redis"""
+    if config.config.WEBHOOK_WORKERS <= 1:
+        return
+    if config.config.STORAGE_BACKEND != "redis":
+        raise ValueError(
+            f"WEBHOOK_WORKERS={config.config.WEBHOOK_WORKERS}: очередь в SQLite работает только "
+            f"в одном процессе, нужен STORAGE_BACKEND=redis"
+        )
+    if config.config.FSM_STORAGE == "memory":
+        print(f"⚠️ WEBHOOK_WORKERS={config.config.WEBHOOK_WORKERS} при FSM_STORAGE=memory: диалог, "
+              f"начатый в одном процессе, не продолжится в другом. Нужен FSM_STORAGE=redis")
+
+
+async def run_webhook():
+    """Принимать обновления через aiohttp-сервер вместо long polling"""
+    from aiohttp import web
+    from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+    check_webhook_workers()
+
+    app = web.Application()
+    # Порядок важен: on_shutdown выполняются по порядку регистрации, и
+    # остановка диспетчера (рассылки, дашборд) должна идти до закрытия
+    # сессии бота, которое добавляет register()
+    setup_application(app, dp, bot=bot)
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=config.config.WEBHOOK_SECRET or None
+    ).register(app, path=config.config.WEBHOOK_PATH)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, config.config.WEBAPP_HOST, config.config.WEBAPP_PORT)
+    await site.start()
+    print(f"🌐 Вебхук слушает {config.config.WEBAPP_HOST}:{config.config.WEBAPP_PORT}{config.config.WEBHOOK_PATH}")
+
+    # Как и start_polling, останавливаемся по SIGINT/SIGTERM
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
             pass
 
+    try:
+        await stop.wait()
+    finally:
+        # Вызывает on_shutdown диспетчера и закрывает сессию бота
+        await runner.cleanup()
+
 
-# ========== ЗАПУСК ==========
 async def main():
     print("🤖 Бот 'Очередь в кабинет Елисея' запущен...")
-    print(f"👑 Админ ID: {config.config.ADMIN_ID}")
+    for office in offices:
+        print(f"🚪 {office.title} ({office.office_id}), админы: {', '.join(map(str, office.admin_ids)) or 'нет'}")
 
-    await dp.start_polling(bot)
+    try:
+        if config.config.RUN_MODE == "webhook":
+            await run_webhook()
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await db.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,199 @@
+import asyncio
+import time
+from typing import Dict, Iterable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from tasks import TaskRunner
+
+
+# ---------------- Ограничение частоты ----------------
+class RateLimiter:
+    """Token bucket: не более rate событий в секунду, всплеск до burst"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# ---------------- Статистика рассылки ----------------
+class BroadcastStats:
+    def __init__(self, total: int):
+        self.total = total
+        self.sent = 0
+        self.blocked = 0  # бот заблокирован / чат недоступен
+        self.failed = 0
+        self.retries = 0  # сколько раз Telegram просил подождать (RetryAfter)
+        self.started_at = time.monotonic()
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def format_progress(self) -> str:
+        return f"📣 <b>Рассылка:</b> {self.done}/{self.total}"
+
+    def format_report(self) -> str:
+        return (
+            f"📣 <b>Уведомление отправлено</b> ({self.done}/{self.total} за {self.elapsed:.0f} сек.)\n"
+            f"✅ Успешно: {self.sent}\n"
+            f"🚫 Заблокировали бота: {self.blocked}\n"
+            f"❌ Не удалось: {self.failed}\n"
+            f"⏳ Ожиданий RetryAfter: {self.retries}"
+        )
+
+
+# ---------------- Рассылка ----------------
+class Broadcaster:
+    """Фоновая рассылка сообщений с учетом лимитов Telegram.
+
+    Сообщения отправляют concurrency воркеров, общий поток ограничен
+    global_rate сообщениями в секунду, в один чат — не чаще раза в
+    chat_interval секунд. На RetryAfter все воркеры ждут указанное время
+    и повторяют отправку, а не теряют сообщение.
+    """
+
+    def __init__(self, bot: Bot, tasks: TaskRunner, concurrency: int = 10,
+                 global_rate: float = 25, chat_interval: float = 1.0,
+                 max_retries: int = 3, progress_interval: float = 5.0):
+        self.bot = bot
+        self.tasks = tasks
+        self.concurrency = concurrency
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+        self._limiter = RateLimiter(global_rate)
+        self._paused_until = 0.0
+        self._chat_last_sent: Dict[int, float] = {}
+
+    def start(self, chat_ids: Iterable[int], text: str,
+              report_chat_id: Optional[int] = None) -> asyncio.Task:
+        """Запустить рассылку в фоне и сразу вернуть управление"""
+        return self.tasks.spawn(self._run(list(chat_ids), text, report_chat_id), name="broadcast")
+
+    async def _run(self, chat_ids, text: str, report_chat_id: Optional[int]):
+        stats = BroadcastStats(len(chat_ids))
+        pending: asyncio.Queue = asyncio.Queue()
+        for chat_id in chat_ids:
+            pending.put_nowait(chat_id)
+
+        progress_message = None
+        if report_chat_id:
+            try:
+                progress_message = await self.bot.send_message(
+                    report_chat_id, stats.format_progress(), parse_mode="HTML"
+                )
+            except Exception as e:
+                print(f"Не удалось отправить прогресс рассылки: {e}")
+
+        workers = [
+            asyncio.create_task(self._worker(pending, text, stats))
+            for _ in range(min(self.concurrency, len(chat_ids)))
+        ]
+        reporter = None
+        if progress_message:
+            reporter = asyncio.create_task(self._report_progress(progress_message, stats))
+
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            if reporter:
+                reporter.cancel()
+            self._forget_old_chats()
+
+        if report_chat_id:
+            await self._send_report(report_chat_id, progress_message, stats)
+        return stats
+
+    async def _worker(self, pending: asyncio.Queue, text: str, stats: BroadcastStats):
+        while not pending.empty():
+            chat_id = pending.get_nowait()
+            await self._send(chat_id, text, stats)
+
+    async def _send(self, chat_id: int, text: str, stats: BroadcastStats):
+        for attempt in range(self.max_retries + 1):
+            await self._wait_turn(chat_id)
+            try:
+                await self.bot.send_message(chat_id, text, parse_mode="HTML")
+                stats.sent += 1
+                return
+            except TelegramRetryAfter as e:
+                # Флуд-контроль касается всего бота, поэтому ставим на паузу всех
+                stats.retries += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            except TelegramForbiddenError:
+                stats.blocked += 1
+                return
+            except Exception as e:
+                stats.failed += 1
+                print(f"Не удалось отправить сообщение пользователю {chat_id}: {e}")
+                return
+        stats.failed += 1
+
+    async def _wait_turn(self, chat_id: int):
+        last_sent = self._chat_last_sent.get(chat_id)
+        if last_sent is not None:
+            wait = last_sent + self.chat_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        # Паузу проверяем уже после получения токена: пока воркер ждал лимитер,
+        # другой воркер мог получить RetryAfter
+        while True:
+            await self._limiter.acquire()
+            pause = self._paused_until - time.monotonic()
+            if pause <= 0:
+                break
+            await asyncio.sleep(pause)
+        self._chat_last_sent[chat_id] = time.monotonic()
+
+    def _forget_old_chats(self):
+        # Держим только чаты, для которых лимит еще действует
+        threshold = time.monotonic() - self.chat_interval
+        self._chat_last_sent = {
+            chat_id: sent_at for chat_id, sent_at in self._chat_last_sent.items()
+            if sent_at > threshold
+        }
+
+    async def _report_progress(self, progress_message, stats: BroadcastStats):
+        last_text = None
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            text = stats.format_progress()
+            if text == last_text:
+                continue
+            try:
+                await progress_message.edit_text(text, parse_mode="HTML")
+                last_text = text
+            except Exception:
+                pass
+
+    async def _send_report(self, chat_id: int, progress_message, stats: BroadcastStats):
+        try:
+            if progress_message:
+                await progress_message.edit_text(stats.format_report(), parse_mode="HTML")
+            else:
+                await self.bot.send_message(chat_id, stats.format_report(), parse_mode="HTML")
+        except Exception as e:
+            print(f"Не удалось отправить отчет о рассылке: {e}")
@@ -8,6 +8,64 @@ load_dotenv()
 class Config:
     BOT_TOKEN: str = os.getenv("BOT_TOKEN")
     ADMIN_ID: int = int(os.getenv("ADMIN_ID", 0))
+    # Кабинеты с отдельными очередями: "id:Название:админ1,админ2;id2:...".
+    # Пусто — один кабинет main с админом ADMIN_ID; очередь, созданная до
+    # появления кабинетов, принадлежит кабинету main
+    OFFICES: str = os.getenv("OFFICES", "")
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
+    # Хранилище очереди: sqlite (SQLITE_PATH) или redis (REDIS_URL, общее для нескольких процессов)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "sqlite")
+    REDIS_PREFIX: str = os.getenv("REDIS_PREFIX", "elisey:")
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", "queue.db")  # файл базы для очереди и FSM в SQLite
+    # SQLite: профиль default или performance (WAL, настроенные PRAGMA, пул соединений для чтения)
+    SQLITE_PROFILE: str = os.getenv("SQLITE_PROFILE", "default")
+    SQLITE_READ_POOL_SIZE: int = int(os.getenv("SQLITE_READ_POOL_SIZE", 4))
+    QUEUE_PAGE_SIZE: int = int(os.getenv("QUEUE_PAGE_SIZE", 20))  # человек на странице "Посмотреть очередь"
+    USER_FLUSH_INTERVAL: float = float(os.getenv("USER_FLUSH_INTERVAL", 5))  # секунд между записью профилей пользователей
+
+    # FSM-хранилище диалогов: memory, sqlite (SQLITE_PATH) или redis (общее для нескольких процессов)
+    FSM_STORAGE: str = os.getenv("FSM_STORAGE", "memory")
+    FSM_STATE_TTL: int = int(os.getenv("FSM_STATE_TTL", 3600))  # секунд, 0 — без ограничения
+
+    # Режим получения обновлений: polling или webhook
+    RUN_MODE: str = os.getenv("RUN_MODE", "polling")
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")  # внешний адрес, например https://bot.example.com
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+    WEBAPP_HOST: str = os.getenv("WEBAPP_HOST", "127.0.0.1")
+    WEBAPP_PORT: int = int(os.getenv("WEBAPP_PORT", 8080))
+    # Сколько процессов бота принимают вебхук за балансировщиком. Больше одного —
+    # только с STORAGE_BACKEND=redis (у SQLite номера в очереди, кэши, дашборд и
+    # сводки админу свои в каждом процессе) и FSM_STORAGE не memory
+    WEBHOOK_WORKERS: int = int(os.getenv("WEBHOOK_WORKERS", 1))
+
+    # Рассылка уведомлений
+    BROADCAST_CONCURRENCY: int = int(os.getenv("BROADCAST_CONCURRENCY", 10))
+    BROADCAST_RATE: float = float(os.getenv("BROADCAST_RATE", 25))  # сообщений в секунду
+    BROADCAST_CHAT_INTERVAL: float = float(os.getenv("BROADCAST_CHAT_INTERVAL", 1))  # секунд между сообщениями в один чат
+
+    # Уведомления админу о новых в очереди
+    ADMIN_DIGEST_WINDOW: float = float(os.getenv("ADMIN_DIGEST_WINDOW", 10))  # секунд сбора записей в одну сводку, 0 — без сводки
+    DASHBOARD_INTERVAL: float = float(os.getenv("DASHBOARD_INTERVAL", 2))  # секунд между правками дашборда очереди
+
+    # Прогноз ожидания по интервалам между принятиями
+    ETA_SMOOTHING: float = float(os.getenv("ETA_SMOOTHING", 0.3))  # вес нового интервала в среднем (0..1)
+    ETA_MAX_GAP: float = float(os.getenv("ETA_MAX_GAP", 1800))  # секунд; более долгие паузы — перерыв, не прием
+    ETA_SAVE_INTERVAL: float = float(os.getenv("ETA_SAVE_INTERVAL", 60))  # секунд между сохранениями оценки
+
+    # Позиции, при достижении которых подписавшимся приходит "скоро твоя очередь" (через запятую)
+    TURN_NOTIFY_POSITIONS: str = os.getenv("TURN_NOTIFY_POSITIONS", "3,1")
+
+    # Защита от частых нажатий: действий в секунду (0 — без ограничения) и запас подряд
+    FLOOD_RATE: float = float(os.getenv("FLOOD_RATE", 1))
+    FLOOD_BURST: float = float(os.getenv("FLOOD_BURST", 4))
+    FLOOD_ADMIN_RATE: float = float(os.getenv("FLOOD_ADMIN_RATE", 5))
+    FLOOD_ADMIN_BURST: float = float(os.getenv("FLOOD_ADMIN_BURST", 20))
+    FLOOD_MAX_USERS: int = int(os.getenv("FLOOD_MAX_USERS", 10000))  # пользователей, чьи счетчики держим в памяти
+
+    # Метрики в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics; 0 — выключены
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", 0))
+    METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+
 config = Config()
\ No newline at end of file
@@ -0,0 +1,100 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup
+
+from tasks import TaskRunner
+
+
+class QueueDashboard:
+    """Живое сообщение с состоянием очереди у каждого админа.
+
+    После изменений очереди сообщение редактируется на месте: не чаще
+    одного раза в interval секунд, изменения за это время сливаются в одну
+    правку, а правка с тем же текстом и кнопками пропускается. id сообщений хранятся
+    в таблице system и переживают перезапуск бота. render(chat_id) рисует
+    дашборд для конкретного админа — каждый видит очередь своего кабинета.
+    """
+
+    # Ответы Telegram, после которых сообщение-дашборд уже не отредактировать
+    GONE_ERRORS = ("message to edit not found", "message can't be edited")
+
+    def __init__(self, bot: Bot, tasks: TaskRunner, db, admin_ids: Iterable[int],
+                 interval: float,
+                 render: Callable[[int], Awaitable[Tuple[str, Optional[InlineKeyboardMarkup]]]]):
+        self.bot = bot
+        self.tasks = tasks
+        self.db = db
+        self.admin_ids = [admin_id for admin_id in admin_ids if admin_id]
+        self.interval = interval
+        self._render = render
+        self._message_ids: Dict[int, int] = {}  # chat_id -> id сообщения-дашборда
+        self._views: Dict[int, Tuple] = {}  # последние показанные (текст, кнопки)
+        self._changed = asyncio.Event()
+
+    @staticmethod
+    def _key(chat_id: int) -> str:
+        return f"dashboard_message:{chat_id}"
+
+    async def start(self):
+        for chat_id in self.admin_ids:
+            message_id = await self.db.get_system_value(self._key(chat_id))
+            if message_id:
+                self._message_ids[chat_id] = int(message_id)
+
+        self.tasks.spawn(self._run(), name="dashboard")
+        # Очередь могла измениться, пока бот был выключен
+        self.touch()
+
+    def touch(self):
+        """Отметить, что очередь изменилась"""
+        self._changed.set()
+
+    async def show(self, chat_id: int):
+        """Отправить новый дашборд; дальше обновляется только он"""
+        view = await self._render(chat_id)
+        text, reply_markup = view
+        message = await self.bot.send_message(chat_id, text, reply_markup=reply_markup, parse_mode="HTML")
+        self._message_ids[chat_id] = message.message_id
+        self._views[chat_id] = view
+        await self.db.set_system_value(self._key(chat_id), str(message.message_id))
+
+    async def _run(self):
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            try:
+                await self._update()
+            except Exception as e:
+                print(f"Не удалось обновить дашборд очереди: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _update(self):
+        if not self._message_ids:
+            return
+
+        for chat_id, message_id in list(self._message_ids.items()):
+            view = await self._render(chat_id)
+            if self._views.get(chat_id) == view:
+                continue
+            text, reply_markup = view
+            try:
+                await self.bot.edit_message_text(
+                    text, chat_id=chat_id, message_id=message_id,
+                    reply_markup=reply_markup, parse_mode="HTML"
+                )
+            except TelegramBadRequest as e:
+                error = str(e).lower()
+                if any(gone in error for gone in self.GONE_ERRORS):
+                    # Сообщение удалено или слишком старое — ждем нового "Управление очередью"
+                    del self._message_ids[chat_id]
+                    self._views.pop(chat_id, None)
+                    await self.db.set_system_value(self._key(chat_id), None)
+                    continue
+                if "not modified" not in error:
+                    # Временная ошибка или ошибка в тексте: дашборд оставляем, попробуем при следующем изменении
+                    print(f"Не удалось обновить дашборд админа {chat_id}: {e}")
+                    continue
+            self._views[chat_id] = view
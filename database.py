@@ -1,164 +1,721 @@
+import asyncio
+import functools
+import itertools
 import sqlite3
-from typing import List, Optional, Dict
-from datetime import datetime
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from queue import SimpleQueue
+from typing import Callable, List, Optional, Dict, Set
 
-DB_PATH = "queue.db"
+import config
+from storage import (DEFAULT_OFFICE, QueueStorage, build_display_name, build_queue_report,
+                     build_queue_stats, iso_to_timestamp, now_timestamp, serving_key)
+
+# Профиль "performance": WAL уже гарантирует целостность при synchronous=NORMAL
+PERFORMANCE_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",  # 16 МБ страничного кэша
+    "PRAGMA mmap_size = 268435456",  # 256 МБ файла отображаются в память
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+def _synchronized(method):
+    """Выполнять метод QueueDB под общей блокировкой"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+# ---------------- Пул соединений для чтения ----------------
+class ReadConnectionPool:
+    """Read-only соединения к базе.
+
+    В режиме WAL читатели не ждут писателя, поэтому чтения из пула идут
+    параллельно с записью через основное соединение.
+    """
+
+    def __init__(self, path: str, size: int):
+        self._connections: SimpleQueue = SimpleQueue()
+        self._all = []
+        for _ in range(size):
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            for pragma in PERFORMANCE_PRAGMAS[1:]:
+                conn.execute(pragma)
+            self._all.append(conn)
+            self._connections.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._connections.get()
+        try:
+            yield conn
+        finally:
+            self._connections.put(conn)
+
+    def close(self):
+        for conn in self._all:
+            conn.close()
+
+
+# ---------------- Позиции в очереди ----------------
+class QueuePositions:
+    """Порядковая статистика очереди на дереве Фенвика.
+
+    Каждый участник получает слот в порядке вставки (по seq), позиция —
+    число занятых слотов до него включительно. Вставка, удаление и поиск
+    позиции работают за O(log n) без обхода всей очереди.
+    """
 
-class QueueDB:
     def __init__(self):
-        self.conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        self._slots: Dict[int, int] = {}  # user_id -> слот
+        self._owners: List[Optional[int]] = [None]  # слот -> user_id
+        self._tree: List[int] = [0]
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._slots
+
+    def load(self, user_ids: List[int]):
+        """Заполнить структуру пользователями в порядке очереди"""
+        self._rebuild(list(user_ids))
+
+    def clear(self):
+        self._rebuild([])
+
+    def add(self, user_id: int) -> int:
+        """Добавить пользователя в конец очереди, вернуть его позицию"""
+        if len(self._owners) >= len(self._tree):
+            self._rebuild(self.ordered_user_ids())
+
+        slot = len(self._owners)
+        self._owners.append(user_id)
+        self._slots[user_id] = slot
+        self._update(slot, 1)
+        return len(self._slots)
+
+    def remove(self, user_id: int) -> Optional[int]:
+        """Удалить пользователя, вернуть позицию, которую он занимал"""
+        slot = self._slots.pop(user_id, None)
+        if slot is None:
+            return None
+        position = self._prefix(slot)
+        self._owners[slot] = None
+        self._update(slot, -1)
+        return position
+
+    def position(self, user_id: int) -> Optional[int]:
+        """Позиция пользователя (1 = первый) или None"""
+        slot = self._slots.get(user_id)
+        if slot is None:
+            return None
+        return self._prefix(slot)
+
+    def find_kth(self, position: int) -> Optional[int]:
+        """user_id на позиции position (1 = первый) или None — спуск по дереву за O(log n)"""
+        if position < 1 or position > len(self._slots):
+            return None
+        slot = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            candidate = slot + step
+            if candidate < len(self._tree) and self._tree[candidate] < position:
+                slot = candidate
+                position -= self._tree[candidate]
+            step >>= 1
+        return self._owners[slot + 1]
+
+    def ordered_user_ids(self) -> List[int]:
+        return [user_id for user_id in self._owners[1:] if user_id is not None]
+
+    # Внутренние операции дерева
+    def _rebuild(self, user_ids: List[int]):
+        # Уплотняем слоты и оставляем запас, чтобы перестройка была редкой
+        capacity = max(16, 2 * len(user_ids))
+        self._owners = [None] + user_ids
+        self._slots = {user_id: slot for slot, user_id in enumerate(user_ids, start=1)}
+        self._tree = [0] * (capacity + 1)
+        for slot in range(1, capacity + 1):
+            if slot <= len(user_ids):
+                self._tree[slot] += 1
+            parent = slot + (slot & -slot)
+            if parent <= capacity:
+                self._tree[parent] += self._tree[slot]
+
+    def _update(self, slot: int, delta: int):
+        while slot < len(self._tree):
+            self._tree[slot] += delta
+            slot += slot & -slot
+
+    def _prefix(self, slot: int) -> int:
+        total = 0
+        while slot > 0:
+            total += self._tree[slot]
+            slot -= slot & -slot
+        return total
+
+
+# ---------------- Миграции схемы ----------------
+# Версия схемы хранится в PRAGMA user_version. Миграция N переводит базу из
+# версии N-1 в N; при запуске выполняются все недостающие, каждая в своей
+# транзакции. Новые миграции добавляются только в конец списка.
+
+def _migration_initial(conn: sqlite3.Connection):
+    """Исходная схема (базы без user_version уже содержат эти таблицы)"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS system (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        display_name TEXT NOT NULL,  -- Имя, отображаемое в очереди
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        registered_at TEXT NOT NULL,
+        last_seen_at TEXT NOT NULL
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS queue (
+        user_id INTEGER PRIMARY KEY,
+        joined_at TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS office_status (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        status TEXT NOT NULL,
+        message TEXT,
+        updated_at TEXT NOT NULL
+    )
+    """)
+
+
+def _migration_queue_seq(conn: sqlite3.Connection):
+    """Монотонный номер вставки seq задает порядок очереди (joined_at мог совпадать)"""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(queue)")]
+    if "seq" not in columns:
+        conn.execute("ALTER TABLE queue ADD COLUMN seq INTEGER")
+    user_ids = [row[0] for row in conn.execute("SELECT user_id FROM queue ORDER BY seq, joined_at, rowid")]
+    conn.executemany(
+        "UPDATE queue SET seq = ? WHERE user_id = ?",
+        [(seq, user_id) for seq, user_id in enumerate(user_ids, start=1)]
+    )
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_queue_seq ON queue (seq)")
+
+
+def _migration_epoch_timestamps(conn: sqlite3.Connection):
+    """ISO-строки -> целые секунды unix-времени; индекс по users.last_seen_at.
+
+    SQLite не меняет тип колонки, поэтому таблицы пересоздаются.
+    Старые строки — локальное время, их переводит Python (strftime('%s')
+    в SQLite считал бы их UTC).
+    """
+    conn.create_function("iso_to_timestamp", 1, iso_to_timestamp, deterministic=True)
+
+    conn.execute("""
+    CREATE TABLE users_new (
+        user_id INTEGER PRIMARY KEY,
+        display_name TEXT NOT NULL,  -- Имя, отображаемое в очереди
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        registered_at INTEGER NOT NULL,
+        last_seen_at INTEGER NOT NULL
+    )
+    """)
+    conn.execute("""
+    INSERT INTO users_new
+    SELECT user_id, display_name, username, first_name, last_name,
+           iso_to_timestamp(registered_at), iso_to_timestamp(last_seen_at)
+    FROM users
+    """)
+
+    conn.execute("""
+    CREATE TABLE queue_new (
+        user_id INTEGER PRIMARY KEY,
+        joined_at INTEGER NOT NULL,
+        seq INTEGER NOT NULL,  -- Монотонный номер вставки, задает порядок очереди
+        FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+    )
+    """)
+    conn.execute("""
+    INSERT INTO queue_new
+    SELECT user_id, iso_to_timestamp(joined_at), seq FROM queue
+    """)
+
+    conn.execute("""
+    CREATE TABLE office_status_new (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        status TEXT NOT NULL,
+        message TEXT,
+        updated_at INTEGER NOT NULL
+    )
+    """)
+    conn.execute("""
+    INSERT INTO office_status_new
+    SELECT id, status, message, iso_to_timestamp(updated_at) FROM office_status
+    """)
+
+    for table in ("queue", "users", "office_status"):
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+    conn.execute("CREATE UNIQUE INDEX idx_queue_seq ON queue (seq)")
+    conn.execute("CREATE INDEX idx_users_last_seen_at ON users (last_seen_at)")
+
+
+def _migration_queue_events(conn: sqlite3.Connection):
+    """Журнал событий очереди: только добавление, строки не меняются и не удаляются"""
+    conn.execute("""
+    CREATE TABLE queue_events (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        event TEXT NOT NULL,  -- joined / accepted / rejected / left / cleared
+        created_at INTEGER NOT NULL,
+        wait INTEGER  -- Секунд в очереди (для всех событий, кроме joined)
+    )
+    """)
+    conn.execute("CREATE INDEX idx_queue_events_created_at ON queue_events (created_at)")
+    conn.execute("CREATE INDEX idx_queue_events_event ON queue_events (event, created_at)")
+
+
+def _migration_turn_notifications(conn: sqlite3.Connection):
+    """Подписка пользователя на уведомления о приближении очереди"""
+    conn.execute("ALTER TABLE users ADD COLUMN notify_turn INTEGER NOT NULL DEFAULT 0")
+
+
+def _migration_offices(conn: sqlite3.Connection):
+    """Несколько кабинетов: office_id у очереди, журнала и статуса кабинета.
+
+    Существующие очередь, журнал и статус относятся к кабинету 'main'.
+    Порядок внутри кабинета — по seq, индекс (office_id, seq).
+    """
+    conn.execute("ALTER TABLE queue ADD COLUMN office_id TEXT NOT NULL DEFAULT 'main'")
+    conn.execute("DROP INDEX idx_queue_seq")
+    conn.execute("CREATE UNIQUE INDEX idx_queue_office_seq ON queue (office_id, seq)")
+
+    conn.execute("ALTER TABLE queue_events ADD COLUMN office_id TEXT NOT NULL DEFAULT 'main'")
+    conn.execute("CREATE INDEX idx_queue_events_office ON queue_events (office_id, event, created_at)")
+
+    conn.execute("""
+    CREATE TABLE office_status_new (
+        office_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        message TEXT,
+        updated_at INTEGER NOT NULL
+    )
+    """)
+    conn.execute("""
+    INSERT INTO office_status_new
+    SELECT 'main', status, message, updated_at FROM office_status
+    """)
+    conn.execute("DROP TABLE office_status")
+    conn.execute("ALTER TABLE office_status_new RENAME TO office_status")
+
+
+def _migration_fsm_state(conn: sqlite3.Connection):
+    """Состояния диалогов FSM (FSM_STORAGE=sqlite); expires_at NULL — без срока.
+
+    IF NOT EXISTS: раньше SQLiteStorage создавал эту таблицу сам.
+    """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS fsm_state (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT NOT NULL DEFAULT '{}',
+        expires_at REAL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_state_expires ON fsm_state (expires_at)")
+
+
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _migration_initial,
+    _migration_queue_seq,
+    _migration_epoch_timestamps,
+    _migration_queue_events,
+    _migration_turn_notifications,
+    _migration_offices,
+    _migration_fsm_state,
+]
+
+
+def migrate(conn: sqlite3.Connection):
+    """Довести схему базы до последней версии"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= len(MIGRATIONS):
+        return
+
+    # Пересоздание таблиц нельзя делать с включенными внешними ключами,
+    # а переключить их можно только вне транзакции
+    conn.execute("PRAGMA foreign_keys = OFF")
+    for number in range(version + 1, len(MIGRATIONS) + 1):
+        conn.execute("BEGIN")
+        try:
+            MIGRATIONS[number - 1](conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    print(f"База данных обновлена до версии {len(MIGRATIONS)}")
+
+
+# ---------------- Кэш состояния ----------------
+class QueueStateCache:
+    """Копия состояния очереди одного кабинета в памяти.
+
+    Хранит упорядоченную очередь, строку office_status и
+    current_serving кабинета. QueueDB обновляет кэш после каждого
+    успешного commit (write-through), а все чтения идут из памяти.
+
+    joined_sum — сумма времен записи всех, кто в очереди: по ней
+    суммарное и среднее ожидание считаются без обхода очереди.
+
+    version растет при каждом изменении очереди или статуса кабинета.
+    Начальное значение берется из времени запуска, чтобы версии не
+    повторялись после перезапуска бота.
+    """
+
+    def __init__(self):
+        self.entries: "OrderedDict[int, Dict]" = OrderedDict()  # user_id -> запись очереди
+        self.positions = QueuePositions()
+        self.office_status: Optional[Dict] = None
+        self.current_serving: Optional[int] = None
+        self.joined_sum = 0
+        self.version = int(time.time() * 1000)
+
+    def load_queue(self, entries: List[Dict]):
+        self.entries = OrderedDict((entry["user_id"], entry) for entry in entries)
+        self.positions.load(list(self.entries))
+        self.joined_sum = sum(entry["joined_at"] for entry in entries)
+        self.version += 1
+
+    def add(self, entry: Dict) -> int:
+        self.entries[entry["user_id"]] = entry
+        self.joined_sum += entry["joined_at"]
+        self.version += 1
+        return self.positions.add(entry["user_id"])
+
+    def remove(self, user_id: int) -> Optional[int]:
+        entry = self.entries.pop(user_id, None)
+        if entry is None:
+            return None
+        self.joined_sum -= entry["joined_at"]
+        self.version += 1
+        return self.positions.remove(user_id)
+
+    def clear(self):
+        self.entries.clear()
+        self.positions.clear()
+        self.joined_sum = 0
+        self.version += 1
+
+    def rename(self, user_id: int, name: str):
+        entry = self.entries.get(user_id)
+        if entry is not None and entry["name"] != name:
+            entry["name"] = name
+            self.version += 1
+
+    def set_office_status(self, office_status: Optional[Dict]):
+        self.office_status = office_status
+        self.version += 1
+
+    def first(self) -> Optional[Dict]:
+        if not self.entries:
+            return None
+        return next(iter(self.entries.values()))
+
+    def head(self, count: int) -> List[Dict]:
+        """Первые count записей (OrderedDict отдает начало за O(count))"""
+        return list(itertools.islice(self.entries.values(), count))
+
+
+class QueueDB(QueueStorage):
+    def __init__(self, path: str = "queue.db", profile: str = "default", read_pool_size: int = 0):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
-        self.cursor = self.conn.cursor()
+        # Запись, кэш и буфер защищены одной блокировкой; чтения из пула идут без нее
+        self._lock = threading.RLock()
+        if profile == "performance":
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            for pragma in PERFORMANCE_PRAGMAS:
+                self.conn.execute(pragma)
+        self._caches: Dict[str, QueueStateCache] = {}  # office_id -> состояние очереди
+        self._empty_cache = QueueStateCache()  # для чтений по кабинетам без данных, не изменяется
+        self._user_offices: Dict[int, str] = {}  # кто в какой очереди стоит
+        self._turn_subscribers: Set[int] = set()  # кто включил уведомления о приближении очереди
+        # Отложенные обновления профилей и last_seen_at: user_id -> поля
+        self._pending_users: Dict[int, Dict] = {}
+        # События журнала, ждущие записи: (user_id, event, created_at, wait, office_id)
+        self._pending_events: List[tuple] = []
         self._setup_tables()
+        self._load_cache()
+        self._readers: Optional[ReadConnectionPool] = None
+        if profile == "performance" and read_pool_size > 0:
+            self._readers = ReadConnectionPool(path, read_pool_size)
 
     def _setup_tables(self):
-        # Таблица для системных данных
-        self.cursor.execute("""
-        CREATE TABLE IF NOT EXISTS system (
-            key TEXT PRIMARY KEY,
-            value TEXT NOT NULL
-        )
-        """)
-
-        # Таблица для ВСЕХ пользователей (основная таблица)
-        self.cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            display_name TEXT NOT NULL,  -- Имя, отображаемое в очереди
-            username TEXT,
-            first_name TEXT,
-            last_name TEXT,
-            registered_at TEXT NOT NULL,
-            last_seen_at TEXT NOT NULL
-        )
-        """)
-        
-        # Таблица для очереди (связь через user_id)
-        self.cursor.execute("""
-        CREATE TABLE IF NOT EXISTS queue (
-            user_id INTEGER PRIMARY KEY,
-            joined_at TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
-        )
-        """)
-        
-        # Таблица для статуса кабинета
-        self.cursor.execute("""
-        CREATE TABLE IF NOT EXISTS office_status (
-            id INTEGER PRIMARY KEY CHECK (id = 1),
-            status TEXT NOT NULL,
-            message TEXT,
-            updated_at TEXT NOT NULL
-        )
-        """)
+        migrate(self.conn)
         
         # Включаем внешние ключи
-        self.cursor.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA foreign_keys = ON")
         
         # Инициализируем статус кабинета, если пусто
-        self.cursor.execute("SELECT COUNT(*) FROM office_status")
-        if self.cursor.fetchone()[0] == 0:
+        cursor = self.conn.execute("SELECT COUNT(*) FROM office_status")
+        if cursor.fetchone()[0] == 0:
             self.set_office_status("closed")
         
         self.conn.commit()
 
+    def _office(self, office_id: str) -> QueueStateCache:
+        """Кэш очереди кабинета для чтения. Для неизвестного кабинета — общий
+        пустой кэш: чтения по произвольным office_id не должны копить кэши"""
+        return self._caches.get(office_id, self._empty_cache)
+
+    def _office_for_update(self, office_id: str) -> QueueStateCache:
+        """Кэш очереди кабинета для изменения (создается при первой записи)"""
+        cache = self._caches.get(office_id)
+        if cache is None:
+            cache = self._caches[office_id] = QueueStateCache()
+        return cache
+
+    def _load_cache(self):
+        """Загрузить очереди, статусы кабинетов и текущих пользователей в память"""
+        cursor = self.conn.execute("""
+        SELECT q.user_id, u.display_name as name, q.joined_at, q.seq, q.office_id
+        FROM queue q
+        LEFT JOIN users u ON q.user_id = u.user_id
+        ORDER BY q.seq
+        """)
+        rows = [dict(row) for row in cursor.fetchall()]
+        self._last_seq = max((row["seq"] for row in rows), default=0)
+        queues: Dict[str, List[Dict]] = {}
+        for row in rows:
+            queues.setdefault(row["office_id"], []).append(self._queue_entry(row))
+            self._user_offices[row["user_id"]] = row["office_id"]
+        for office_id, entries in queues.items():
+            self._office_for_update(office_id).load_queue(entries)
+
+        for row in self.conn.execute("SELECT * FROM office_status"):
+            self._office_for_update(row["office_id"]).set_office_status(dict(row))
+
+        cursor = self.conn.execute(
+            "SELECT key, value FROM system WHERE key = 'current_serving' OR key LIKE 'current_serving:%'"
+        )
+        for key, value in cursor.fetchall():
+            office_id = key.partition(":")[2] or DEFAULT_OFFICE
+            self._office_for_update(office_id).current_serving = int(value)
+
+        cursor = self.conn.execute("SELECT user_id FROM users WHERE notify_turn = 1")
+        self._turn_subscribers = {row[0] for row in cursor.fetchall()}
+
+    @staticmethod
+    def _queue_entry(row: Dict) -> Dict:
+        return {"user_id": row["user_id"], "name": row["name"], "joined_at": row["joined_at"]}
+
+    def _read(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        """Выполнить SELECT через пул чтения, а без него — через основное соединение"""
+        if self._readers is None:
+            with self._lock:
+                return self.conn.execute(sql, params).fetchall()
+        with self._readers.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    # ---------------- Отложенная запись пользователей ----------------
+
+    def _buffer_user(self, user_id: int, **fields):
+        """Запомнить обновление пользователя; None не затирает уже известные поля"""
+        record = self._pending_users.setdefault(user_id, {})
+        record.update({field: value for field, value in fields.items() if value is not None})
+
+    def _write_pending_users(self, user_ids: Optional[List[int]] = None):
+        """Записать накопленные обновления (все или только user_ids) без commit"""
+        if user_ids is None:
+            records, self._pending_users = self._pending_users, {}
+        else:
+            records = {
+                user_id: self._pending_users.pop(user_id)
+                for user_id in user_ids if user_id in self._pending_users
+            }
+        if not records:
+            return
+
+        profiles = [(user_id, r) for user_id, r in records.items() if "display_name" in r]
+        touches = [(user_id, r) for user_id, r in records.items() if "display_name" not in r]
+
+        self.conn.executemany("""
+        INSERT INTO users
+        (user_id, display_name, username, first_name, last_name, registered_at, last_seen_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            display_name = excluded.display_name,
+            username = COALESCE(excluded.username, username),
+            first_name = COALESCE(excluded.first_name, first_name),
+            last_name = COALESCE(excluded.last_name, last_name),
+            last_seen_at = excluded.last_seen_at
+        """, [
+            (user_id, r["display_name"], r.get("username"), r.get("first_name"),
+             r.get("last_name"), r.get("registered_at", r["last_seen_at"]), r["last_seen_at"])
+            for user_id, r in profiles
+        ])
+        self.conn.executemany(
+            "UPDATE users SET last_seen_at = ? WHERE user_id = ?",
+            [(r["last_seen_at"], user_id) for user_id, r in touches]
+        )
+
+    @_synchronized
+    def flush_user_updates(self) -> int:
+        """Записать все отложенные обновления пользователей одной транзакцией"""
+        count = len(self._pending_users)
+        if count:
+            self._write_pending_users()
+            self.conn.commit()
+        return count
+
+    # ---------------- Журнал событий ----------------
+
+    def _log_event(self, user_id: int, event: str, office_id: str, joined_at: Optional[int] = None):
+        """Добавить событие в буфер журнала; в базу оно попадет при flush_events()"""
+        now = now_timestamp()
+        wait = now - joined_at if joined_at is not None else None
+        self._pending_events.append((user_id, event, now, wait, office_id))
+
+    @_synchronized
+    def flush_events(self) -> int:
+        """Записать накопленные события журнала одной транзакцией"""
+        count = len(self._pending_events)
+        if count:
+            self.conn.executemany(
+                "INSERT INTO queue_events (user_id, event, created_at, wait, office_id) VALUES (?, ?, ?, ?, ?)",
+                self._pending_events
+            )
+            self.conn.commit()
+            self._pending_events = []
+        return count
+
+    def get_queue_report(self, since: int, until: int, office_id: Optional[str] = None) -> Dict:
+        """Отчет по журналу за [since, until): диапазонные запросы по индексам
+        (event, created_at) и (office_id, event, created_at)"""
+        self.flush_events()
+        office_filter, params = "", (since, until)
+        if office_id is not None:
+            office_filter, params = "AND office_id = ?", (since, until, office_id)
+        counts = self._read(f"""
+        SELECT event, COUNT(*) FROM queue_events
+        WHERE created_at >= ? AND created_at < ? {office_filter}
+        GROUP BY event
+        """, params)
+        waits = self._read(f"""
+        SELECT wait FROM queue_events
+        WHERE event = 'accepted' AND created_at >= ? AND created_at < ? {office_filter}
+        ORDER BY wait
+        """, params)
+        return build_queue_report(
+            since, until, {row[0]: row[1] for row in counts}, [row[0] for row in waits]
+        )
+
     # ---------------- Пользователи ----------------
 
+    @_synchronized
     def add_or_update_user(self, user_id: int, username: str = None, 
                           first_name: str = None, last_name: str = None) -> str:
-        """Добавить или обновить пользователя, возвращает display_name"""
-        now = datetime.now().isoformat()
+        """Добавить или обновить пользователя, возвращает display_name.
+
+        Запись в базу отложена до flush_user_updates().
+        """
+        now = now_timestamp()
         
         # Формируем display_name из данных Telegram
-        display_name = first_name or ""
-        if last_name:
-            if display_name:
-                display_name += f" {last_name}"
-            else:
-                display_name = last_name
+        display_name = build_display_name(user_id, username, first_name, last_name)
         
-        # Если нет имени и фамилии, используем username
-        if not display_name or display_name.strip() == "":
-            if username:
-                display_name = f"@{username}"
-            else:
-                display_name = f"User_{user_id}"
-        
-        # Добавляем/обновляем пользователя
-        self.cursor.execute("""
-        INSERT OR IGNORE INTO users 
-        (user_id, display_name, username, first_name, last_name, registered_at, last_seen_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (user_id, display_name, username, first_name, last_name, now, now))
-        
-        self.cursor.execute("""
-        UPDATE users SET 
-            display_name = COALESCE(?, display_name),
-            username = COALESCE(?, username),
-            first_name = COALESCE(?, first_name),
-            last_name = COALESCE(?, last_name),
-            last_seen_at = ?
-        WHERE user_id = ?
-        """, (display_name, username, first_name, last_name, now, user_id))
-        
-        self.conn.commit()
+        self._buffer_user(
+            user_id,
+            display_name=display_name,
+            username=username,
+            first_name=first_name,
+            last_name=last_name,
+            last_seen_at=now
+        )
+        self._pending_users[user_id].setdefault("registered_at", now)
+        self._rename_in_queue(user_id, display_name)
         return display_name
 
+    def _rename_in_queue(self, user_id: int, name: str):
+        office_id = self._user_offices.get(user_id)
+        if office_id is not None:
+            self._caches[office_id].rename(user_id, name)
+
     def get_all_users(self) -> List[Dict]:
         """Получить всех пользователей бота"""
-        self.cursor.execute("SELECT * FROM users")
-        rows = self.cursor.fetchall()
+        self.flush_user_updates()
+        rows = self._read("SELECT * FROM users")
         return [dict(row) for row in rows]
 
     def get_all_user_ids(self) -> List[int]:
         """Получить только ID всех пользователей"""
-        self.cursor.execute("SELECT user_id FROM users")
-        return [row[0] for row in self.cursor.fetchall()]
+        self.flush_user_updates()
+        return [row[0] for row in self._read("SELECT user_id FROM users")]
 
+    @_synchronized
     def update_user_display_name(self, user_id: int, new_display_name: str) -> bool:
         """Изменить отображаемое имя пользователя (обновляет и в очереди через связь)"""
         if len(new_display_name.strip()) < 2:
             return False
         
-        now = datetime.now().isoformat()
+        # Сначала пишем отложенный профиль, чтобы он не перезаписал новое имя
+        self._write_pending_users([user_id])
         
         # Обновляем имя в таблице users
-        self.cursor.execute("""
+        cursor = self.conn.execute("""
         UPDATE users SET 
-            display_name = ?,
-            last_seen_at = ?
+            display_name = ?
         WHERE user_id = ?
-        """, (new_display_name.strip(), now, user_id))
+        """, (new_display_name.strip(), user_id))
         
-        changed = self.cursor.rowcount
+        changed = cursor.rowcount
         self.conn.commit()
+        if changed > 0:
+            self._rename_in_queue(user_id, new_display_name.strip())
+            self._buffer_user(user_id, last_seen_at=now_timestamp())
         
         return changed > 0
 
     def get_user_display_name(self, user_id: int) -> Optional[str]:
         """Получить отображаемое имя пользователя"""
-        self.cursor.execute(
-            "SELECT display_name FROM users WHERE user_id = ?",
-            (user_id,)
-        )
-        row = self.cursor.fetchone()
-        return row[0] if row else None
+        pending = self._pending_users.get(user_id)
+        if pending and "display_name" in pending:
+            return pending["display_name"]
+        rows = self._read("SELECT display_name FROM users WHERE user_id = ?", (user_id,))
+        return rows[0][0] if rows else None
 
     def get_user_full_info(self, user_id: int) -> Optional[Dict]:
         """Получить полную информацию о пользователе"""
-        self.cursor.execute(
-            "SELECT * FROM users WHERE user_id = ?",
-            (user_id,)
-        )
-        row = self.cursor.fetchone()
-        return dict(row) if row else None
+        self.flush_user_updates()
+        rows = self._read("SELECT * FROM users WHERE user_id = ?", (user_id,))
+        return dict(rows[0]) if rows else None
 
     # ---------------- Очередь ----------------
 
-    def add_to_queue(self, user_id: int, name: str = None) -> int:
-        """Добавить пользователя в очередь, вернуть его позицию"""
-        # Проверка, не в очереди ли уже
-        if self.get_user_position(user_id):
+    @_synchronized
+    def add_to_queue(self, user_id: int, name: str = None, office_id: str = DEFAULT_OFFICE) -> int:
+        """Добавить пользователя в очередь кабинета, вернуть его позицию"""
+        # Проверка, не стоит ли уже в какой-либо очереди
+        if user_id in self._user_offices:
             return -1
         
         # Если имя не указано, берем из таблицы users
@@ -168,154 +725,432 @@ class QueueDB:
                 # Создаем пользователя с базовыми данными
                 name = f"User_{user_id}"
         
+        # Отложенный профиль пишем в этой же транзакции
+        self._write_pending_users([user_id])
+        
         # Убеждаемся, что пользователь есть в таблице users
-        self.cursor.execute("SELECT COUNT(*) FROM users WHERE user_id = ?", (user_id,))
-        if self.cursor.fetchone()[0] == 0:
+        cursor = self.conn.execute("SELECT COUNT(*) FROM users WHERE user_id = ?", (user_id,))
+        if cursor.fetchone()[0] == 0:
             # Добавляем пользователя с минимальными данными
-            self.cursor.execute(
+            self.conn.execute(
                 "INSERT INTO users (user_id, display_name, registered_at, last_seen_at) VALUES (?, ?, ?, ?)",
-                (user_id, name, datetime.now().isoformat(), datetime.now().isoformat())
+                (user_id, name, now_timestamp(), now_timestamp())
             )
         else:
-            # Обновляем display_name если нужно
-            self.cursor.execute(
-                "UPDATE users SET display_name = ?, last_seen_at = ? WHERE user_id = ?",
-                (name, datetime.now().isoformat(), user_id)
+            # Обновляем display_name если нужно, last_seen_at запишется отложенно
+            self.conn.execute(
+                "UPDATE users SET display_name = ? WHERE user_id = ?",
+                (name, user_id)
             )
+            self._buffer_user(user_id, last_seen_at=now_timestamp())
         
         # Добавляем в очередь
-        joined_at = datetime.now().isoformat()
-        self.cursor.execute(
-            "INSERT INTO queue (user_id, joined_at) VALUES (?, ?)",
-            (user_id, joined_at)
+        joined_at = now_timestamp()
+        seq = self._last_seq + 1
+        self.conn.execute(
+            "INSERT INTO queue (user_id, joined_at, seq, office_id) VALUES (?, ?, ?, ?)",
+            (user_id, joined_at, seq, office_id)
         )
         self.conn.commit()
-        return self.get_user_position(user_id)
+        self._last_seq = seq
+        self._user_offices[user_id] = office_id
+        self._log_event(user_id, "joined", office_id)
+        return self._office_for_update(office_id).add({"user_id": user_id, "name": name, "joined_at": joined_at})
+
+    def _forget(self, cache: QueueStateCache, user_id: int, event: str, office_id: str) -> Optional[int]:
+        """Убрать снятого из очереди из кэша и записать событие, вернуть его позицию"""
+        self._log_event(user_id, event, office_id, cache.entries[user_id]["joined_at"])
+        self._user_offices.pop(user_id, None)
+        return cache.remove(user_id)
 
-    def remove_from_queue(self, user_id: int) -> bool:
-        """Удалить пользователя из очереди"""
-        self.cursor.execute("DELETE FROM queue WHERE user_id = ?", (user_id,))
-        changed = self.cursor.rowcount
+    @_synchronized
+    def remove_from_queue(self, user_id: int, reason: str = "left") -> Optional[int]:
+        """Удалить пользователя из очереди, вернуть позицию, которую он занимал"""
+        office_id = self._user_offices.get(user_id)
+        if office_id is None:
+            return None
+        cursor = self.conn.execute("DELETE FROM queue WHERE user_id = ?", (user_id,))
+        changed = cursor.rowcount
         self.conn.commit()
-        return changed > 0
+        if changed == 0:
+            return None
+        return self._forget(self._caches[office_id], user_id, reason, office_id)
 
-    def get_queue(self) -> List[Dict]:
+    @_synchronized
+    def get_queue(self, office_id: str = DEFAULT_OFFICE) -> List[Dict]:
         """Получить всю очередь в порядке добавления с именами пользователей"""
-        self.cursor.execute("""
-        SELECT q.user_id, u.display_name as name, q.joined_at
-        FROM queue q
-        LEFT JOIN users u ON q.user_id = u.user_id
-        ORDER BY q.joined_at
-        """)
-        rows = self.cursor.fetchall()
-        return [dict(row) for row in rows]
+        return [dict(entry) for entry in self._office(office_id).entries.values()]
+
+    @_synchronized
+    def get_user_office(self, user_id: int) -> Optional[str]:
+        """Кабинет, в очереди которого стоит пользователь"""
+        return self._user_offices.get(user_id)
 
+    @_synchronized
     def get_user_position(self, user_id: int) -> Optional[int]:
-        """Получить позицию пользователя в очереди (1 = первый)"""
-        queue = self.get_queue()
-        for i, user in enumerate(queue, start=1):
-            if user["user_id"] == user_id:
-                return i
-        return None
-
-    def clear_queue(self):
-        """Очистить всю очередь"""
-        self.cursor.execute("DELETE FROM queue")
+        """Получить позицию пользователя в его очереди (1 = первый), O(log n)"""
+        office_id = self._user_offices.get(user_id)
+        if office_id is None:
+            return None
+        return self._caches[office_id].positions.position(user_id)
+
+    @_synchronized
+    def get_queue_length(self, office_id: str = DEFAULT_OFFICE) -> int:
+        """Количество людей в очереди"""
+        return len(self._office(office_id).entries)
+
+    @_synchronized
+    def clear_queue(self, office_id: str = DEFAULT_OFFICE):
+        """Очистить всю очередь кабинета"""
+        self.conn.execute("DELETE FROM queue WHERE office_id = ?", (office_id,))
         self.conn.commit()
+        cache = self._office_for_update(office_id)
+        for entry in cache.entries.values():
+            self._log_event(entry["user_id"], "cleared", office_id, entry["joined_at"])
+            self._user_offices.pop(entry["user_id"], None)
+        cache.clear()
+
+    def _delete_head(self, office_id: str, expected_user_id: Optional[int] = None) -> Optional[int]:
+        """DELETE ... RETURNING первого в очереди кабинета (без commit), вернуть его user_id"""
+        sql = """
+        DELETE FROM queue
+        WHERE office_id = ? AND seq = (SELECT MIN(seq) FROM queue WHERE office_id = ?)
+        """
+        params = (office_id, office_id)
+        if expected_user_id is not None:
+            sql += " AND user_id = ?"
+            params += (expected_user_id,)
+        rows = self.conn.execute(sql + " RETURNING user_id", params).fetchall()
+        return rows[0]["user_id"] if rows else None
 
-    def get_next_user(self) -> Optional[Dict]:
+    @_synchronized
+    def get_next_user(self, office_id: str = DEFAULT_OFFICE) -> Optional[Dict]:
         """Получить следующего пользователя и удалить его из очереди"""
-        self.cursor.execute("""
-        SELECT q.user_id, u.display_name as name, q.joined_at
-        FROM queue q
-        LEFT JOIN users u ON q.user_id = u.user_id
-        ORDER BY q.joined_at LIMIT 1
-        """)
-        row = self.cursor.fetchone()
-        if row:
-            user = dict(row)
-            self.remove_from_queue(user["user_id"])
-            return user
-        return None
+        user_id = self._delete_head(office_id)
+        self.conn.commit()
+        if user_id is None:
+            return None
+        cache = self._office_for_update(office_id)
+        entry = dict(cache.entries[user_id])
+        self._forget(cache, user_id, "accepted", office_id)
+        return entry
+
+    @_synchronized
+    def serve_next(self, expected_user_id: Optional[int] = None,
+                   office_id: str = DEFAULT_OFFICE) -> Optional[Dict]:
+        """Принять первого: снять с очереди и записать в current_serving одной транзакцией"""
+        user_id = self._delete_head(office_id, expected_user_id)
+        if user_id is None:
+            return None
 
+        self.conn.execute(
+            "INSERT OR REPLACE INTO system (key, value) VALUES (?, ?)",
+            (serving_key(office_id), str(user_id))
+        )
+        self.conn.commit()
+
+        cache = self._office_for_update(office_id)
+        served = dict(cache.entries[user_id])
+        self._forget(cache, user_id, "accepted", office_id)
+        cache.current_serving = user_id
+        next_entry = cache.first()
+        return {"served": served, "next": dict(next_entry) if next_entry else None}
+
+    @_synchronized
     def get_user_info(self, user_id: int) -> Optional[Dict]:
         """Получить информацию о пользователе в очереди"""
-        self.cursor.execute("""
-        SELECT q.user_id, u.display_name as name, q.joined_at
-        FROM queue q
-        LEFT JOIN users u ON q.user_id = u.user_id
-        WHERE q.user_id = ?
-        """, (user_id,))
-        row = self.cursor.fetchone()
-        return dict(row) if row else None
-
-    def search_user_by_name(self, search_term: str) -> List[Dict]:
-        """Поиск пользователя по имени (частичному совпадению)"""
-        self.cursor.execute("""
-        SELECT q.user_id, u.display_name as name, q.joined_at
-        FROM queue q
-        LEFT JOIN users u ON q.user_id = u.user_id
-        WHERE u.display_name LIKE ? 
-        ORDER BY q.joined_at
-        """, (f"%{search_term}%",))
-        rows = self.cursor.fetchall()
-        return [dict(row) for row in rows]
+        office_id = self._user_offices.get(user_id)
+        if office_id is None:
+            return None
+        return dict(self._caches[office_id].entries[user_id])
+
+    @_synchronized
+    def search_user_by_name(self, search_term: str, office_id: str = DEFAULT_OFFICE) -> List[Dict]:
+        """Поиск пользователя в очереди по имени (частичному совпадению)"""
+        term = search_term.casefold()
+        return [
+            dict(entry) for entry in self._office(office_id).entries.values()
+            if entry["name"] and term in entry["name"].casefold()
+        ]
+
+    @_synchronized
+    def get_queue_stats(self, office_id: str = DEFAULT_OFFICE) -> Dict:
+        """Статистика очереди по счетчикам кэша, без обхода очереди"""
+        cache = self._office(office_id)
+        head = [dict(entry) for entry in cache.head(2)]
+        return build_queue_stats(len(cache.entries), cache.joined_sum, head)
+
+    @_synchronized
+    def get_queue_page(self, after_seq: Optional[int] = None, before_seq: Optional[int] = None,
+                       start_user_id: Optional[int] = None, limit: int = 20,
+                       office_id: str = DEFAULT_OFFICE) -> Dict:
+        """Страница очереди по индексу (office_id, seq) (keyset-пагинация, без OFFSET)"""
+        cache = self._office(office_id)
+        if start_user_id is not None and start_user_id in cache.entries:
+            row = self.conn.execute("SELECT seq FROM queue WHERE user_id = ?", (start_user_id,)).fetchone()
+            after_seq = row["seq"] - 1
+
+        # Индекс (office_id, seq) покрывает запрос: user_id — это rowid таблицы
+        if before_seq is not None:
+            rows = self.conn.execute(
+                "SELECT user_id, seq FROM queue WHERE office_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (office_id, before_seq, limit)
+            ).fetchall()[::-1]
+        else:
+            rows = self.conn.execute(
+                "SELECT user_id, seq FROM queue WHERE office_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (office_id, after_seq or 0, limit)
+            ).fetchall()
+
+        # Страница опустела (ее участников уже приняли) — показываем начало очереди
+        if not rows and cache.entries:
+            rows = self.conn.execute(
+                "SELECT user_id, seq FROM queue WHERE office_id = ? ORDER BY seq LIMIT ?",
+                (office_id, limit)
+            ).fetchall()
+
+        total = len(cache.entries)
+        entries = []
+        if rows:
+            first_position = cache.positions.position(rows[0]["user_id"])
+            for offset, row in enumerate(rows):
+                entry = dict(cache.entries[row["user_id"]])
+                entry["seq"] = row["seq"]
+                entry["position"] = first_position + offset
+                entries.append(entry)
+
+        return {
+            "entries": entries,
+            "total": total,
+            "has_prev": bool(entries) and entries[0]["position"] > 1,
+            "has_next": bool(entries) and entries[-1]["position"] < total,
+        }
+
+    @_synchronized
+    def get_queue_version(self, office_id: str = DEFAULT_OFFICE) -> int:
+        """Версия очереди: меняется при каждом изменении очереди или статуса"""
+        return self._office(office_id).version
+
+    @_synchronized
+    def get_queue_snapshot(self, office_id: str = DEFAULT_OFFICE) -> Dict:
+        """Согласованный снимок: версия, очередь и статус кабинета"""
+        return {
+            "version": self._office(office_id).version,
+            "queue": self.get_queue(office_id),
+            "office_status": self.get_office_status(office_id),
+        }
+
+    # ---------------- Уведомления о приближении очереди ----------------
+
+    @_synchronized
+    def set_turn_notifications(self, user_id: int, enabled: bool) -> bool:
+        """Включить или выключить уведомления о приближении очереди"""
+        self._write_pending_users([user_id])
+        cursor = self.conn.execute(
+            "UPDATE users SET notify_turn = ? WHERE user_id = ?", (int(enabled), user_id)
+        )
+        self.conn.commit()
+        if cursor.rowcount == 0:
+            return False
+        if enabled:
+            self._turn_subscribers.add(user_id)
+        else:
+            self._turn_subscribers.discard(user_id)
+        return True
+
+    def get_turn_notifications(self, user_id: int) -> bool:
+        return user_id in self._turn_subscribers
+
+    @_synchronized
+    def get_turn_candidates(self, positions: List[int], office_id: str = DEFAULT_OFFICE) -> List[Dict]:
+        """Подписчики на позициях positions: find_kth по дереву Фенвика, O(log n) на позицию"""
+        cache = self._office(office_id)
+        candidates = []
+        for position in positions:
+            user_id = cache.positions.find_kth(position)
+            if user_id is not None and user_id in self._turn_subscribers:
+                entry = dict(cache.entries[user_id])
+                entry["position"] = position
+                candidates.append(entry)
+        return candidates
 
     # ---------------- Статус кабинета ----------------
-    def set_office_status(self, status: str, message: str = ""):
+    @_synchronized
+    def set_office_status(self, status: str, message: str = "", office_id: str = DEFAULT_OFFICE):
         """Установить статус кабинета (open/closed/paused)"""
-        updated_at = datetime.now().isoformat()
-        self.cursor.execute("""
-        INSERT INTO office_status (id, status, message, updated_at)
-        VALUES (1, ?, ?, ?)
-        ON CONFLICT(id) DO UPDATE SET
+        updated_at = now_timestamp()
+        self.conn.execute("""
+        INSERT INTO office_status (office_id, status, message, updated_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(office_id) DO UPDATE SET
             status=excluded.status,
             message=excluded.message,
             updated_at=excluded.updated_at
-        """, (status, message, updated_at))
+        """, (office_id, status, message, updated_at))
         self.conn.commit()
+        self._office_for_update(office_id).set_office_status({
+            "office_id": office_id, "status": status, "message": message, "updated_at": updated_at
+        })
 
-    def get_office_status(self) -> Dict:
+    @_synchronized
+    def get_office_status(self, office_id: str = DEFAULT_OFFICE) -> Dict:
         """Получить статус кабинета"""
-        self.cursor.execute("SELECT * FROM office_status WHERE id = 1")
-        row = self.cursor.fetchone()
-        if row:
-            return dict(row)
-        return {"status": "closed", "message": "", "updated_at": datetime.now().isoformat()}
+        office_status = self._office(office_id).office_status
+        if office_status:
+            return dict(office_status)
+        return {"office_id": office_id, "status": "closed", "message": "", "updated_at": now_timestamp()}
 
     # ---------------- Управление очередью ----------------
-    def get_first_user_in_queue(self) -> Optional[Dict]:
+    @_synchronized
+    def get_first_user_in_queue(self, office_id: str = DEFAULT_OFFICE) -> Optional[Dict]:
         """Получить первого пользователя в очереди (без удаления)"""
-        self.cursor.execute("""
-        SELECT q.user_id, u.display_name as name, q.joined_at
-        FROM queue q
-        LEFT JOIN users u ON q.user_id = u.user_id
-        ORDER BY q.joined_at LIMIT 1
-        """)
-        row = self.cursor.fetchone()
-        return dict(row) if row else None
+        entry = self._office(office_id).first()
+        return dict(entry) if entry else None
 
-    def get_current_serving_user(self) -> Optional[int]:
+    @_synchronized
+    def get_current_serving_user(self, office_id: str = DEFAULT_OFFICE) -> Optional[int]:
         """Получить ID пользователя, которого сейчас принимают (если есть)"""
-        self.cursor.execute("SELECT value FROM system WHERE key = 'current_serving'")
-        row = self.cursor.fetchone()
-        return int(row[0]) if row else None
+        return self._office(office_id).current_serving
 
-    def set_current_serving_user(self, user_id: Optional[int]):
+    @_synchronized
+    def set_current_serving_user(self, user_id: Optional[int], office_id: str = DEFAULT_OFFICE):
         """Установить ID пользователя, которого сейчас принимают"""
         if user_id is None:
-            self.cursor.execute("DELETE FROM system WHERE key = 'current_serving'")
+            self.conn.execute("DELETE FROM system WHERE key = ?", (serving_key(office_id),))
         else:
-            self.cursor.execute("""
+            self.conn.execute("""
             INSERT OR REPLACE INTO system (key, value)
-            VALUES ('current_serving', ?)
-            """, (str(user_id),))
+            VALUES (?, ?)
+            """, (serving_key(office_id), str(user_id)))
         self.conn.commit()
+        self._office_for_update(office_id).current_serving = user_id
+
+    # ---------------- Системные значения ----------------
+    @_synchronized
+    def get_system_value(self, key: str) -> Optional[str]:
+        """Получить значение из таблицы system"""
+        row = self.conn.execute("SELECT value FROM system WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    @_synchronized
+    def set_system_value(self, key: str, value: Optional[str]):
+        """Записать значение в таблицу system (None — удалить)"""
+        if value is None:
+            self.conn.execute("DELETE FROM system WHERE key = ?", (key,))
+        else:
+            self.conn.execute("INSERT OR REPLACE INTO system (key, value) VALUES (?, ?)", (key, value))
+        self.conn.commit()
+
+    @_synchronized
+    def close(self):
+        """Записать отложенные обновления и закрыть соединения с базой"""
+        self.flush_user_updates()
+        self.flush_events()
+        if self._readers:
+            self._readers.close()
+        self.conn.close()
+
+
+# ---------------- Асинхронный доступ ----------------
+class AsyncQueueDB:
+    """Асинхронная обертка над хранилищем очереди.
+
+    Повторяет публичные методы QueueStorage, но каждый вызов выполняется
+    в пуле потоков, поэтому запросы и commit() не блокируют event loop.
+    По умолчанию поток один; несколько потоков имеют смысл вместе с пулом
+    чтения QueueDB (профиль performance), чтобы чтения не ждали записи.
+    """
+
+    def __init__(self, queue_db: QueueStorage, workers: int = 1):
+        self._db = queue_db
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="queue-db")
+        self._flush_task: Optional[asyncio.Task] = None
+        self._observe: Optional[Callable[[str, float], None]] = None
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        method = getattr(self._db, name)
+        if not callable(method):
+            raise AttributeError(name)
+
+        observe = self._observe
+        if observe is None:
+            @functools.wraps(method)
+            async def wrapper(*args, **kwargs):
+                return await self._run(method, *args, **kwargs)
+        else:
+            @functools.wraps(method)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await self._run(method, *args, **kwargs)
+                finally:
+                    observe(name, time.perf_counter() - started)
+
+        # Кэшируем обертку, чтобы не создавать ее при каждом вызове
+        setattr(self, name, wrapper)
+        return wrapper
+
+    def set_timer(self, observe: Callable[[str, float], None]):
+        """Замерять каждый вызов: observe(имя метода, секунды).
+
+        Без таймера обертки не тратят время на замеры.
+        """
+        self._observe = observe
+        # Уже созданные обертки — без замера, пересоздаем их при следующем вызове
+        for name in [name for name in vars(self) if not name.startswith("_")]:
+            delattr(self, name)
+
+    def start_flushing(self, interval: float):
+        """Периодически сбрасывать отложенные обновления пользователей и журнал событий"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop(interval))
+
+    async def _flush_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._run(self._db.flush_user_updates)
+                await self._run(self._db.flush_events)
+            except Exception as e:
+                print(f"Не удалось записать отложенные обновления: {e}")
+
+    async def close(self):
+        """Дождаться текущих запросов и закрыть базу"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self._run(self._db.close)
+        self._executor.shutdown(wait=True)
 
-    def is_user_being_served(self, user_id: int) -> bool:
-        """Проверяет, обслуживается ли пользователь сейчас"""
-        current = self.get_current_serving_user()
-        return current == user_id
 
 # ---------------- Экземпляр ----------------
-db = QueueDB()
+def create_db() -> QueueStorage:
+    """Создать хранилище очереди по настройке STORAGE_BACKEND"""
+    if config.config.STORAGE_BACKEND == "redis":
+        from redis_storage import RedisQueueDB
+        return RedisQueueDB.from_url(config.config.REDIS_URL, prefix=config.config.REDIS_PREFIX)
+    return QueueDB(
+        path=config.config.SQLITE_PATH,
+        profile=config.config.SQLITE_PROFILE,
+        read_pool_size=config.config.SQLITE_READ_POOL_SIZE
+    )
+
+
+def db_workers() -> int:
+    """Число потоков AsyncQueueDB: писатель плюс по потоку на соединение чтения"""
+    if config.config.STORAGE_BACKEND == "sqlite" and config.config.SQLITE_PROFILE == "performance":
+        return 1 + config.config.SQLITE_READ_POOL_SIZE
+    return 1
+
+
+db = create_db()
+adb = AsyncQueueDB(db, workers=db_workers())
@@ -0,0 +1,66 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram import Bot
+
+import render
+from tasks import TaskRunner
+
+
+class JoinDigest:
+    """Сводка новых записей в очередь кабинета для его админов.
+
+    Записи, пришедшие в течение window секунд после первой, собираются в
+    одно сообщение: кто встал, сколько всего и кто в начале очереди.
+    Если человек встал в пустую очередь, сводка уходит сразу — его могут
+    принять немедленно. При window = 0 каждая запись отправляется отдельно.
+    """
+
+    def __init__(self, bot: Bot, tasks: TaskRunner, chat_ids: Iterable[int], window: float,
+                 get_head: Callable[[], Awaitable[Dict]]):
+        self.bot = bot
+        self.tasks = tasks
+        self.chat_ids = [chat_id for chat_id in chat_ids if chat_id]
+        self.window = window
+        self._get_head = get_head  # первая страница очереди: {"entries", "total"}
+        self._joins: List[Tuple[str, int]] = []
+        self._timer: Optional[asyncio.Task] = None
+
+    async def add(self, user_name: str, position: int):
+        if not self.chat_ids:
+            return
+
+        self._joins.append((user_name, position))
+        if self.window <= 0 or position == 1:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = self.tasks.schedule(self.window, self._flush_later, name="join_digest")
+
+    async def _flush_later(self):
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Отправить накопленные записи одним сообщением"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._joins:
+            return
+
+        joins, self._joins = self._joins, []
+        try:
+            head = await self._get_head()
+            text = render.render_join_notification(joins, head["entries"], head["total"])
+        except Exception as e:
+            print(f"Не удалось подготовить уведомление админу: {e}")
+            return
+
+        for chat_id in self.chat_ids:
+            try:
+                await self.bot.send_message(chat_id, text, parse_mode="HTML")
+            except Exception as e:
+                print(f"Не удалось отправить уведомление админу {chat_id}: {e}")
+
+    async def close(self):
+        await self.flush()
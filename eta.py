@@ -0,0 +1,82 @@
+import asyncio
+import json
+import time
+from typing import Optional
+
+from tasks import TaskRunner
+
+
+class ServiceTimeEstimator:
+    """Оценка времени приема одного человека для прогноза ожидания.
+
+    После каждого принятия интервал с предыдущего принятия входит в
+    экспоненциально сглаженное среднее (вес нового интервала — alpha).
+    Интервалы длиннее max_gap (кабинет закрыт, перерыв) не учитываются.
+    Оценка живет в памяти и раз в save_interval секунд, если изменилась,
+    сохраняется в таблицу system под ключом key, чтобы пережить перезапуск
+    бота. У каждого кабинета своя оценка.
+    """
+
+    def __init__(self, tasks: TaskRunner, db, alpha: float, max_gap: float, save_interval: float,
+                 key: str = "service_time"):
+        self.tasks = tasks
+        self.db = db
+        self.key = key
+        self.alpha = min(max(alpha, 0.01), 1.0)
+        self.max_gap = max_gap
+        self.save_interval = save_interval
+        self.average: Optional[float] = None  # секунд на одного человека
+        self.last_accept_at: Optional[float] = None
+        self._dirty = False
+
+    async def start(self):
+        try:
+            saved = await self.db.get_system_value(self.key)
+            if saved:
+                state = json.loads(saved)
+                self.average = state.get("average")
+                self.last_accept_at = state.get("last_accept_at")
+        except Exception as e:
+            print(f"Не удалось загрузить оценку времени приема: {e}")
+
+        self.tasks.spawn(self._run(), name=self.key)
+
+    def record_accept(self, now: Optional[float] = None):
+        """Учесть очередное принятие"""
+        now = time.time() if now is None else now
+        if self.last_accept_at is not None:
+            gap = now - self.last_accept_at
+            if 0 < gap <= self.max_gap:
+                if self.average is None:
+                    self.average = gap
+                else:
+                    self.average += self.alpha * (gap - self.average)
+        self.last_accept_at = now
+        self._dirty = True
+
+    def estimate(self, position: int) -> Optional[float]:
+        """Примерное ожидание (секунд) для позиции position; None — пока нет данных"""
+        if self.average is None:
+            return None
+        return position * self.average
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.save_interval)
+            try:
+                await self.save()
+            except Exception as e:
+                print(f"Не удалось сохранить оценку времени приема: {e}")
+
+    async def save(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        state = {"average": self.average, "last_accept_at": self.last_accept_at}
+        await self.db.set_system_value(self.key, json.dumps(state))
+
+    async def close(self):
+        try:
+            await self.save()
+        except Exception as e:
+            print(f"Не удалось сохранить оценку времени приема: {e}")
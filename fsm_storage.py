@@ -0,0 +1,115 @@
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import config
+from database import migrate
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в SQLite (таблица fsm_state рядом с очередью, схема — в миграциях database.py).
+
+    Состояние и данные диалога переживают перезапуск бота. Записи, к которым
+    не обращались дольше ttl секунд, считаются устаревшими и удаляются.
+    Запросы выполняются в отдельном потоке, чтобы не блокировать event loop.
+    """
+
+    PURGE_INTERVAL = 60  # секунд между чистками устаревших записей
+
+    def __init__(self, path: str, ttl: Optional[int] = None):
+        self.ttl = ttl
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        # Очередь может храниться в Redis, тогда схему базы никто больше не обновит
+        migrate(self.conn)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-db")
+        self._last_purge = 0.0
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    def _expires_at(self) -> Optional[float]:
+        return time.time() + self.ttl if self.ttl else None
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _read(self, key: str) -> Optional[sqlite3.Row]:
+        row = self.conn.execute(
+            "SELECT state, data, expires_at FROM fsm_state WHERE key = ?", (key,)
+        ).fetchone()
+        if row and row[2] is not None and row[2] < time.time():
+            self.conn.execute("DELETE FROM fsm_state WHERE key = ?", (key,))
+            self.conn.commit()
+            return None
+        return row
+
+    def _write(self, key: str, column: str, value: Optional[str]):
+        now = time.time()
+        self.conn.execute(f"""
+        INSERT INTO fsm_state (key, {column}, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET {column} = excluded.{column}, expires_at = excluded.expires_at
+        """, (key, value, self._expires_at()))
+        # Пустой диалог хранить незачем
+        self.conn.execute(
+            "DELETE FROM fsm_state WHERE key = ? AND state IS NULL AND data = '{}'", (key,)
+        )
+        if now - self._last_purge > self.PURGE_INTERVAL:
+            self.conn.execute("DELETE FROM fsm_state WHERE expires_at < ?", (now,))
+            self._last_purge = now
+        self.conn.commit()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._run(self._write, self._key(key), "state", value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await self._run(self._read, self._key(key))
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        value = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        await self._run(self._write, self._key(key), "data", value)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await self._run(self._read, self._key(key))
+        return json.loads(row[1]) if row else {}
+
+    async def close(self) -> None:
+        await self._run(self.conn.close)
+        self._executor.shutdown(wait=True)
+
+
+def create_fsm_storage() -> BaseStorage:
+    """Создать FSM-хранилище по настройке FSM_STORAGE (memory/sqlite/redis)"""
+    ttl = config.config.FSM_STATE_TTL or None
+
+    if config.config.FSM_STORAGE == "redis":
+        from aiogram.fsm.storage.redis import DefaultKeyBuilder, RedisStorage
+        return RedisStorage.from_url(
+            config.config.REDIS_URL,
+            key_builder=DefaultKeyBuilder(prefix=f"{config.config.REDIS_PREFIX}fsm"),
+            state_ttl=ttl,
+            data_ttl=ttl
+        )
+
+    if config.config.FSM_STORAGE == "sqlite":
+        return SQLiteStorage(config.config.SQLITE_PATH, ttl=ttl)
+
+    return MemoryStorage()
+
+
+def create_events_isolation():
+    """Блокировка обработки событий одного пользователя между процессами (только для Redis)"""
+    if config.config.FSM_STORAGE == "redis":
+        from aiogram.fsm.storage.redis import RedisEventIsolation
+        return RedisEventIsolation.from_url(config.config.REDIS_URL)
+    return None
@@ -1,12 +1,36 @@
+from typing import Dict, Iterable, Optional
+
+from aiogram.filters.callback_data import CallbackData
 from aiogram.types import (ReplyKeyboardMarkup, KeyboardButton, 
                           InlineKeyboardMarkup, InlineKeyboardButton)
 
+from storage import DEFAULT_OFFICE
+
+# Тексты кнопок reply-клавиатур: по ним же бот находит обработчик
+BTN_VIEW_QUEUE = "👀 Посмотреть очередь"
+BTN_MY_POSITION = "🔍 Мой номер в очереди"
+BTN_LEAVE = "🚪 Выйти из очереди"
+BTN_JOIN = "📝 Встать в очередь"
+BTN_STATUS = "⏰ Статус кабинета"
+BTN_NOTIFICATIONS = "🔔 Уведомления"
+BTN_OPEN = "✅ Открыть кабинет"
+BTN_CLOSE = "❌ Закрыть кабинет"
+BTN_MANAGE = "👤 Управление очередью"
+BTN_CHANGE_NAME = "✏️ Изменить имя"
+BTN_CLEAR = "🗑️ Очистить очередь"
+BTN_STATS = "📊 Статистика очереди"
+BTN_BACK = "◀️ Назад в меню"
+BTN_CANCEL = "❌ Отмена"
+# Начало текста старых кнопок "Принять <имя>" / "Отклонить <имя>"
+ACCEPT_PREFIX = "✅ Принять "
+REJECT_PREFIX = "❌ Отклонить "
+
 # Основная клавиатура для пользователей
 def get_user_keyboard():
     buttons = [
-        [KeyboardButton(text="👀 Посмотреть очередь"), KeyboardButton(text="🔍 Мой номер в очереди")],
-        [KeyboardButton(text="🚪 Выйти из очереди"), KeyboardButton(text="📝 Встать в очередь")],
-        [KeyboardButton(text="⏰ Статус кабинета")]
+        [KeyboardButton(text=BTN_VIEW_QUEUE), KeyboardButton(text=BTN_MY_POSITION)],
+        [KeyboardButton(text=BTN_LEAVE), KeyboardButton(text=BTN_JOIN)],
+        [KeyboardButton(text=BTN_STATUS), KeyboardButton(text=BTN_NOTIFICATIONS)]
     ]
     
     return ReplyKeyboardMarkup(
@@ -18,10 +42,10 @@ def get_user_keyboard():
 # Админ-клавиатура
 def get_admin_keyboard():
     buttons = [
-        [KeyboardButton(text="❌ Закрыть кабинет"), KeyboardButton(text="✅ Открыть кабинет")],
-        [KeyboardButton(text="👤 Управление очередью"), KeyboardButton(text="👀 Посмотреть очередь")],
-        [KeyboardButton(text="✏️ Изменить имя"), KeyboardButton(text="⏰ Статус кабинета")],
-        [KeyboardButton(text="🗑️ Очистить очередь")],
+        [KeyboardButton(text=BTN_CLOSE), KeyboardButton(text=BTN_OPEN)],
+        [KeyboardButton(text=BTN_MANAGE), KeyboardButton(text=BTN_VIEW_QUEUE)],
+        [KeyboardButton(text=BTN_CHANGE_NAME), KeyboardButton(text=BTN_STATUS)],
+        [KeyboardButton(text=BTN_CLEAR)],
     ]
     
     return ReplyKeyboardMarkup(
@@ -30,22 +54,12 @@ def get_admin_keyboard():
         input_field_placeholder="Админ-команды"
     )
 
-# Клавиатура управления очередью (динамическая)
-def get_queue_management_keyboard(first_user_name: str = None):
-    buttons = []
-    
-    if first_user_name:
-        # Если есть пользователь в очереди
-        buttons = [
-            [KeyboardButton(text=f"❌ Отклонить {first_user_name}"), KeyboardButton(text=f"✅ Принять {first_user_name}")],
-            [KeyboardButton(text="◀️ Назад в меню"), KeyboardButton(text="📊 Статистика очереди")],
-        ]
-    else:
-        # Если очередь пуста
-        buttons = [
-            [KeyboardButton(text="📊 Статистика очереди")],
-            [KeyboardButton(text="◀️ Назад в меню")]
-        ]
+# Клавиатура управления очередью (принять/отклонить — inline-кнопки дашборда)
+def get_queue_management_keyboard():
+    buttons = [
+        [KeyboardButton(text=BTN_STATS)],
+        [KeyboardButton(text=BTN_BACK)]
+    ]
     
     return ReplyKeyboardMarkup(
         keyboard=buttons,
@@ -56,7 +70,79 @@ def get_queue_management_keyboard(first_user_name: str = None):
 # Клавиатура для отмены действия
 def get_cancel_keyboard():
     return ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text="❌ Отмена")]],
+        keyboard=[[KeyboardButton(text=BTN_CANCEL)]],
         resize_keyboard=True,
         one_time_keyboard=True
     )
+
+# Листание очереди: direction = first / prev / next / me, seq — граница текущей страницы,
+# office — кабинет, чья очередь показана
+class QueuePage(CallbackData, prefix="queue_page"):
+    direction: str
+    seq: int = 0
+    office: str = DEFAULT_OFFICE
+
+def get_queue_page_keyboard(page: Dict, office_id: str, show_my_position: bool = False,
+                            other_offices: Iterable = ()) -> Optional[InlineKeyboardMarkup]:
+    entries = page["entries"]
+    navigation = []
+    if page["has_prev"]:
+        navigation.append(InlineKeyboardButton(
+            text="◀️", callback_data=QueuePage(direction="prev", seq=entries[0]["seq"], office=office_id).pack()
+        ))
+    if page["has_next"]:
+        navigation.append(InlineKeyboardButton(
+            text="▶️", callback_data=QueuePage(direction="next", seq=entries[-1]["seq"], office=office_id).pack()
+        ))
+
+    buttons = [navigation] if navigation else []
+    if show_my_position:
+        buttons.append([InlineKeyboardButton(
+            text="📍 Где я?", callback_data=QueuePage(direction="me", office=office_id).pack()
+        )])
+    # Переключение на очереди других кабинетов
+    switch = [
+        InlineKeyboardButton(
+            text=f"🚪 {office.title}",
+            callback_data=QueuePage(direction="first", office=office.office_id).pack()
+        )
+        for office in other_offices
+    ]
+    if switch:
+        buttons.append(switch)
+
+    return InlineKeyboardMarkup(inline_keyboard=buttons) if buttons else None
+
+# Выбор кабинета, в очередь которого встать
+class JoinOffice(CallbackData, prefix="join_office"):
+    office_id: str
+
+def get_office_choice_keyboard(offices: Iterable) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text=f"🚪 {office.title}",
+            callback_data=JoinOffice(office_id=office.office_id).pack()
+        )]
+        for office in offices
+    ])
+
+# Решение по первому в очереди: action = accept / reject. Версию очереди
+# кнопки не несут: решение проверяется по тому, кто сейчас первый
+class QueueAction(CallbackData, prefix="queue_action"):
+    action: str
+    user_id: int
+
+def get_queue_action_keyboard(first_user: Optional[Dict]) -> Optional[InlineKeyboardMarkup]:
+    if not first_user:
+        return None
+
+    def button(text: str, action: str) -> InlineKeyboardButton:
+        return InlineKeyboardButton(
+            text=text,
+            callback_data=QueueAction(action=action, user_id=first_user["user_id"]).pack()
+        )
+
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        button(f"{REJECT_PREFIX}{first_user['name']}", "reject"),
+        button(f"{ACCEPT_PREFIX}{first_user['name']}", "accept"),
+    ]])
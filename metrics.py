@@ -0,0 +1,233 @@
+import bisect
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import (TelegramBadRequest, TelegramForbiddenError,
+                                TelegramRetryAfter)
+from aiogram.types import TelegramObject
+
+
+# ---------------- Метрики ----------------
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Метрика с метками; значения хранятся по кортежу значений меток"""
+
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def clear(self):
+        self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._values.items()):
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key: Tuple[str, ...], value) -> List[str]:
+        return [f"{self.name}{_labels(self.label_names, key)} {value}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    """Гистограмма: счетчики по верхним границам корзин, сумма и количество"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)):
+        super().__init__(name, help_text, labels)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value: float, *labels: str):
+        state = self._values.get(labels)
+        if state is None:
+            # [счетчики корзин (последняя — +Inf), сумма, количество]
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def _render_value(self, key: Tuple[str, ...], value) -> List[str]:
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip([*self.buckets, "+Inf"], counts):
+            cumulative += bucket_count
+            le = f'le="{bound}"'
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total}")
+        lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Набор метрик и функции, обновляющие метрики-снимки перед выдачей"""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Callable[[], Awaitable[None]]] = []
+
+    def add(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def on_collect(self, collector: Callable[[], Awaitable[None]]):
+        self._collectors.append(collector)
+
+    async def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                await collector()
+            except Exception as e:
+                print(f"Не удалось собрать метрики: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+handler_seconds = registry.add(Histogram(
+    "elisey_handler_seconds", "Время обработки события Telegram", ["handler"]
+))
+handler_errors = registry.add(Counter(
+    "elisey_handler_errors_total", "Исключения в обработчиках", ["handler"]
+))
+db_seconds = registry.add(Histogram(
+    "elisey_db_seconds", "Время вызова метода хранилища вместе с ожиданием потока", ["method"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+))
+queue_length = registry.add(Gauge(
+    "elisey_queue_length", "Людей в очереди", ["office"]
+))
+office_status = registry.add(Gauge(
+    "elisey_office_status", "Текущий статус кабинета (1 у действующего)", ["office", "status"]
+))
+telegram_requests = registry.add(Counter(
+    "elisey_telegram_requests_total", "Запросы к Bot API по результату", ["method", "outcome"]
+))
+telegram_retry_after = registry.add(Counter(
+    "elisey_telegram_retry_after_total", "Ответы RetryAfter от Bot API", ["method"]
+))
+
+
+# ---------------- Сбор ----------------
+class HandlerMetrics(BaseMiddleware):
+    """Время и ошибки обработчиков; кнопки клавиатуры — по имени своего обработчика"""
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        text_command = data.get("text_command")
+        if text_command is not None:
+            name = text_command[0].__name__
+        else:
+            handler_object = data.get("handler")
+            name = handler_object.callback.__name__ if handler_object else "unknown"
+
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - started, name)
+
+
+class RequestMetrics(BaseRequestMiddleware):
+    """Исходы всех запросов бота к Telegram: ok, retry_after, forbidden, bad_request, error"""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        try:
+            response = await make_request(bot, method)
+        except TelegramRetryAfter:
+            telegram_requests.inc(name, "retry_after")
+            telegram_retry_after.inc(name)
+            raise
+        except TelegramForbiddenError:
+            telegram_requests.inc(name, "forbidden")
+            raise
+        except TelegramBadRequest:
+            telegram_requests.inc(name, "bad_request")
+            raise
+        except Exception:
+            telegram_requests.inc(name, "error")
+            raise
+        telegram_requests.inc(name, "ok")
+        return response
+
+
+def install(dp, bot, db):
+    """Включить сбор: обработчики, запросы к Telegram и вызовы хранилища.
+
+    Без вызова install ничего из этого не подключается и не стоит времени.
+    """
+    handler_metrics = HandlerMetrics()
+    dp.message.middleware(handler_metrics)
+    dp.callback_query.middleware(handler_metrics)
+    bot.session.middleware(RequestMetrics())
+    db.set_timer(lambda method, seconds: db_seconds.observe(seconds, method))
+
+
+# ---------------- HTTP ----------------
+class MetricsServer:
+    """Отдает метрики в текстовом формате Prometheus по GET /metrics"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self):
+        from aiohttp import web
+
+        async def handle(request):
+            return web.Response(
+                text=await registry.render(),
+                headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+            )
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"📈 Метрики: http://{self.host}:{self.port}/metrics")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,90 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+import config
+from storage import DEFAULT_OFFICE
+
+
+@dataclass
+class Office:
+    office_id: str
+    title: str
+    admin_ids: List[int] = field(default_factory=list)
+
+
+def parse_offices(spec: str, default_admin_id: int = 0) -> List[Office]:
+    """Кабинеты из строки вида "main:Кабинет Елисея:111,222;lab:Лаборатория:333".
+
+    Пустая строка — один кабинет по умолчанию с админом ADMIN_ID.
+    """
+    offices = []
+    for part in spec.split(";"):
+        if not part.strip():
+            continue
+        office_id, _, rest = part.strip().partition(":")
+        title, _, admins = rest.partition(":")
+        office_id = office_id.strip()
+        if not office_id:
+            raise ValueError(f"OFFICES: не указан id кабинета в '{part}'")
+        admin_ids = [int(admin_id) for admin_id in admins.split(",") if admin_id.strip().isdigit()]
+        offices.append(Office(office_id, title.strip() or office_id, admin_ids))
+
+    if not offices:
+        offices.append(Office(DEFAULT_OFFICE, "Кабинет", [default_admin_id] if default_admin_id else []))
+
+    ids = [office.office_id for office in offices]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"OFFICES: id кабинетов повторяются: {', '.join(ids)}")
+    return offices
+
+
+class OfficeRegistry:
+    """Кабинеты бота, их админы и блокировки очередей.
+
+    У каждого кабинета своя asyncio-блокировка: составные операции над
+    очередью (проверить и встать, принять первого) в одном кабинете идут
+    по очереди, а в разных кабинетах не ждут друг друга. Админ нескольких
+    кабинетов управляет первым из них.
+    """
+
+    def __init__(self, offices: List[Office]):
+        self._offices: Dict[str, Office] = {office.office_id: office for office in offices}
+        self._admin_offices: Dict[int, Office] = {}
+        for office in offices:
+            for admin_id in office.admin_ids:
+                self._admin_offices.setdefault(admin_id, office)
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def __iter__(self) -> Iterator[Office]:
+        return iter(self._offices.values())
+
+    def __len__(self) -> int:
+        return len(self._offices)
+
+    @property
+    def default(self) -> Office:
+        return next(iter(self._offices.values()))
+
+    @property
+    def admin_ids(self) -> List[int]:
+        return list(self._admin_offices)
+
+    def get(self, office_id: Optional[str]) -> Optional[Office]:
+        return self._offices.get(office_id)
+
+    def admin_office(self, user_id: int) -> Optional[Office]:
+        """Кабинет, которым управляет админ, или None, если user_id не админ"""
+        return self._admin_offices.get(user_id)
+
+    def is_admin(self, user_id: int) -> bool:
+        return user_id in self._admin_offices
+
+    def lock(self, office_id: str) -> asyncio.Lock:
+        lock = self._locks.get(office_id)
+        if lock is None:
+            lock = self._locks[office_id] = asyncio.Lock()
+        return lock
+
+
+offices = OfficeRegistry(parse_offices(config.config.OFFICES, config.config.ADMIN_ID))
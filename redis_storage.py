@@ -0,0 +1,596 @@
+import json
+from typing import List, NamedTuple, Optional, Dict
+
+import redis
+
+from storage import (DEFAULT_OFFICE, QueueStorage, build_display_name, build_queue_report,
+                     build_queue_stats, iso_to_timestamp, now_timestamp, serving_key)
+
+# Версия формата данных в Redis (system.format_version):
+# 1 — метки времени в секундах unix-времени, сумма времен записи в queue:joined_sum
+# 2 — несколько кабинетов, индекс queue:office (кто в очереди какого кабинета)
+FORMAT_VERSION = 2
+
+
+# Атомарная постановка в очередь: проверка, номер seq и вставка в одном скрипте.
+# KEYS[8] — queue:office, человек стоит не больше чем в одной очереди
+JOIN_SCRIPT = """
+if redis.call('HEXISTS', KEYS[8], ARGV[1]) == 1 then
+    return -1
+end
+redis.call('HSETNX', KEYS[4], 'registered_at', ARGV[3])
+redis.call('HSET', KEYS[4], 'display_name', ARGV[2], 'last_seen_at', ARGV[3])
+redis.call('SADD', KEYS[5], ARGV[1])
+local seq = redis.call('INCR', KEYS[3])
+redis.call('ZADD', KEYS[1], seq, ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+redis.call('HSET', KEYS[8], ARGV[1], ARGV[4])
+redis.call('INCRBY', KEYS[7], ARGV[3])
+redis.call('INCR', KEYS[6])
+return redis.call('ZRANK', KEYS[1], ARGV[1]) + 1
+"""
+
+# Ключи скриптов снятия из очереди: queue, queue:joined, queue:version,
+# queue:joined_sum кабинета и общий queue:office. Время записи снятого
+# вычитается из суммы.
+
+# Атомарно убрать пользователя ARGV[1] из очереди, вернуть {позиция, joined_at}
+# (false, если его не было в очереди)
+REMOVE_SCRIPT = """
+local rank = redis.call('ZRANK', KEYS[1], ARGV[1])
+if not rank then
+    return false
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+local joined_at = redis.call('HGET', KEYS[2], ARGV[1])
+redis.call('DECRBY', KEYS[4], joined_at or 0)
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[5], ARGV[1])
+redis.call('INCR', KEYS[3])
+return {rank + 1, joined_at or ''}
+"""
+
+# Атомарно снять первого из очереди
+POP_HEAD_SCRIPT = """
+local head = redis.call('ZRANGE', KEYS[1], 0, 0)
+if #head == 0 then
+    return false
+end
+local joined_at = redis.call('HGET', KEYS[2], head[1])
+redis.call('ZREM', KEYS[1], head[1])
+redis.call('HDEL', KEYS[2], head[1])
+redis.call('HDEL', KEYS[5], head[1])
+redis.call('DECRBY', KEYS[4], joined_at or 0)
+redis.call('INCR', KEYS[3])
+return {head[1], joined_at}
+"""
+
+# Принять первого: снять его, записать в поле ARGV[2] hash system (KEYS[6]) и
+# вернуть {user_id, joined_at, следующий user_id или ''}. ARGV[1] — ожидаемый
+# первый ('' — любой)
+SERVE_NEXT_SCRIPT = """
+local head = redis.call('ZRANGE', KEYS[1], 0, 0)
+if #head == 0 or (ARGV[1] ~= '' and head[1] ~= ARGV[1]) then
+    return false
+end
+local joined_at = redis.call('HGET', KEYS[2], head[1])
+redis.call('ZREM', KEYS[1], head[1])
+redis.call('HDEL', KEYS[2], head[1])
+redis.call('HDEL', KEYS[5], head[1])
+redis.call('DECRBY', KEYS[4], joined_at or 0)
+redis.call('INCR', KEYS[3])
+redis.call('HSET', KEYS[6], ARGV[2], head[1])
+local next_head = redis.call('ZRANGE', KEYS[1], 0, 0)
+return {head[1], joined_at, next_head[1] or ''}
+"""
+
+# Очистить очередь кабинета, вернуть бывший queue:joined (user_id, joined_at, ...)
+CLEAR_SCRIPT = """
+local joined = redis.call('HGETALL', KEYS[2])
+for i = 1, #joined, 2 do
+    redis.call('HDEL', KEYS[5], joined[i])
+end
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[4])
+redis.call('INCR', KEYS[3])
+return joined
+"""
+
+
+class OfficeKeys(NamedTuple):
+    """Ключи очереди и статуса одного кабинета"""
+    queue: str
+    joined: str
+    joined_sum: str
+    version: str
+    status: str
+
+
+class RedisQueueDB(QueueStorage):
+    """Хранилище очереди в Redis.
+
+    Раскладка ключей (все с префиксом prefix) для кабинета по умолчанию;
+    у остальных кабинетов ключи очереди начинаются с office:<id>:queue,
+    а статус лежит в office:<id>:status:
+    - queue          — sorted set user_id с номером вставки seq в качестве score
+    - queue:joined   — hash user_id -> joined_at
+    - queue:joined_sum — сумма queue:joined (для статистики ожидания)
+    - queue:version  — версия очереди, растет при каждом изменении
+    - office_status  — hash статуса кабинета
+
+    Общие для всех кабинетов:
+    - queue:seq      — счетчик seq
+    - queue:office   — hash user_id -> кабинет, в очереди которого он стоит
+    - users:<id>     — hash с профилем пользователя
+    - user_ids       — set всех пользователей бота
+    - system         — hash системных значений (current_serving, format_version)
+    - queue:events   — sorted set журнала событий (JSON) со временем события в качестве score
+    - queue:events:seq — счетчик записей журнала (делает записи уникальными)
+
+    Позиция — один ZRANK, постановка в очередь атомарна (Lua), поэтому
+    одну очередь могут обслуживать несколько процессов бота. Скрипты
+    трогают только ключи своего кабинета и queue:office.
+    """
+
+    def __init__(self, client: redis.Redis, prefix: str = "elisey:"):
+        self.client = client
+        self.prefix = prefix
+        self.seq_key = f"{prefix}queue:seq"
+        self.offices_key = f"{prefix}queue:office"
+        self.user_ids_key = f"{prefix}user_ids"
+        self.system_key = f"{prefix}system"
+        self.events_key = f"{prefix}queue:events"
+        self.events_seq_key = f"{prefix}queue:events:seq"
+
+        # События журнала, ждущие записи: (user_id, event, created_at, wait, office_id)
+        self._pending_events: List[tuple] = []
+
+        self._join = self.client.register_script(JOIN_SCRIPT)
+        self._remove = self.client.register_script(REMOVE_SCRIPT)
+        self._pop_head = self.client.register_script(POP_HEAD_SCRIPT)
+        self._serve_next = self.client.register_script(SERVE_NEXT_SCRIPT)
+        self._clear = self.client.register_script(CLEAR_SCRIPT)
+
+        self._migrate()
+
+        if not self.client.exists(self._keys(DEFAULT_OFFICE).status):
+            self.set_office_status("closed")
+
+    @classmethod
+    def from_url(cls, url: str, prefix: str = "elisey:") -> "RedisQueueDB":
+        return cls(redis.Redis.from_url(url, decode_responses=True), prefix=prefix)
+
+    def _keys(self, office_id: str) -> OfficeKeys:
+        # Не кэшируем: office_id может прийти откуда угодно, а строки собираются быстрее запроса к Redis
+        if office_id == DEFAULT_OFFICE:
+            queue, status = f"{self.prefix}queue", f"{self.prefix}office_status"
+        else:
+            queue, status = f"{self.prefix}office:{office_id}:queue", f"{self.prefix}office:{office_id}:status"
+        return OfficeKeys(
+            queue=queue,
+            joined=f"{queue}:joined",
+            joined_sum=f"{queue}:joined_sum",
+            version=f"{queue}:version",
+            status=status,
+        )
+
+    def _removal_keys(self, office_id: str) -> List[str]:
+        keys = self._keys(office_id)
+        return [keys.queue, keys.joined, keys.version, keys.joined_sum, self.offices_key]
+
+    # ---------------- Формат данных ----------------
+
+    def _migrate(self):
+        """Перевести данные, записанные старыми версиями бота, в текущий формат"""
+        version = int(self.client.hget(self.system_key, "format_version") or 0)
+        if version >= FORMAT_VERSION:
+            return
+        if version < 1:
+            self._convert_timestamps()
+        if version < 2:
+            self._index_offices()
+        self.client.hset(self.system_key, "format_version", FORMAT_VERSION)
+        print(f"Данные в Redis обновлены до формата {FORMAT_VERSION}")
+
+    def _convert_timestamps(self):
+        """ISO-строки -> секунды unix-времени, пересчет queue:joined_sum"""
+        main = self._keys(DEFAULT_OFFICE)
+        joined = {
+            user_id: iso_to_timestamp(joined_at)
+            for user_id, joined_at in self.client.hgetall(main.joined).items()
+        }
+
+        user_ids = list(self.client.smembers(self.user_ids_key))
+        pipe = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hmget(self._user_key(user_id), "registered_at", "last_seen_at")
+        profiles = pipe.execute()
+
+        pipe = self.client.pipeline()
+        if joined:
+            pipe.hset(main.joined, mapping=joined)
+        pipe.set(main.joined_sum, sum(joined.values()))
+        # Счетчики предыдущей раскладки (время записи в мс)
+        pipe.delete(f"{self.prefix}queue:joined_ms")
+        for user_id, (registered_at, last_seen_at) in zip(user_ids, profiles):
+            fields = {
+                field: iso_to_timestamp(value)
+                for field, value in (("registered_at", registered_at), ("last_seen_at", last_seen_at))
+                if value is not None
+            }
+            if fields:
+                pipe.hset(self._user_key(user_id), mapping=fields)
+        updated_at = self.client.hget(main.status, "updated_at")
+        if updated_at is not None:
+            pipe.hset(main.status, "updated_at", iso_to_timestamp(updated_at))
+        pipe.execute()
+
+    def _index_offices(self):
+        """Очередь до появления кабинетов — очередь кабинета по умолчанию"""
+        user_ids = self.client.zrange(self._keys(DEFAULT_OFFICE).queue, 0, -1)
+        if user_ids:
+            self.client.hset(self.offices_key, mapping={user_id: DEFAULT_OFFICE for user_id in user_ids})
+
+    # ---------------- Журнал событий ----------------
+
+    def _log_event(self, user_id: int, event: str, office_id: str, joined_at: Optional[int] = None):
+        """Добавить событие в буфер журнала; в Redis оно попадет при flush_events()"""
+        now = now_timestamp()
+        wait = now - joined_at if joined_at is not None else None
+        self._pending_events.append((user_id, event, now, wait, office_id))
+
+    def flush_events(self) -> int:
+        """Записать накопленные события журнала одним запросом"""
+        events, self._pending_events = self._pending_events, []
+        if not events:
+            return 0
+        last_id = self.client.incrby(self.events_seq_key, len(events))
+        mapping = {}
+        for event_id, (user_id, event, created_at, wait, office_id) in enumerate(
+                events, last_id - len(events) + 1):
+            member = json.dumps({
+                "id": event_id, "user_id": user_id, "event": event, "wait": wait, "office": office_id
+            })
+            mapping[member] = created_at
+        self.client.zadd(self.events_key, mapping)
+        return len(events)
+
+    def get_queue_report(self, since: int, until: int, office_id: Optional[str] = None) -> Dict:
+        self.flush_events()
+        counts: Dict[str, int] = {}
+        waits = []
+        for member in self.client.zrangebyscore(self.events_key, since, f"({until}"):
+            event = json.loads(member)
+            if office_id is not None and event.get("office", DEFAULT_OFFICE) != office_id:
+                continue
+            counts[event["event"]] = counts.get(event["event"], 0) + 1
+            if event["event"] == "accepted" and event["wait"] is not None:
+                waits.append(event["wait"])
+        return build_queue_report(since, until, counts, sorted(waits))
+
+    def _user_key(self, user_id: int) -> str:
+        return f"{self.prefix}users:{user_id}"
+
+    def _queue_entries(self, user_ids: List[str], office_id: str) -> List[Dict]:
+        """Собрать записи очереди (имя и время) для списка user_id"""
+        if not user_ids:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hget(self._user_key(user_id), "display_name")
+        pipe.hmget(self._keys(office_id).joined, user_ids)
+        *names, joined = pipe.execute()
+        return [
+            # joined_at пуст, если человека сняли с очереди между запросами
+            {"user_id": int(user_id), "name": name,
+             "joined_at": int(joined_at) if joined_at is not None else now_timestamp()}
+            for user_id, name, joined_at in zip(user_ids, names, joined)
+        ]
+
+    def _touch_user_queue(self, pipe, user_id: int):
+        """Добавить в pipe смену версии очереди, в которой стоит пользователь (имя на экране)"""
+        office_id = self.client.hget(self.offices_key, user_id)
+        if office_id is not None:
+            pipe.incr(self._keys(office_id).version)
+
+    # ---------------- Пользователи ----------------
+
+    def add_or_update_user(self, user_id: int, username: str = None,
+                           first_name: str = None, last_name: str = None) -> str:
+        now = now_timestamp()
+        display_name = build_display_name(user_id, username, first_name, last_name)
+
+        fields = {"display_name": display_name, "last_seen_at": now}
+        for field, value in (("username", username), ("first_name", first_name),
+                             ("last_name", last_name)):
+            if value is not None:
+                fields[field] = value
+
+        pipe = self.client.pipeline()
+        pipe.hsetnx(self._user_key(user_id), "registered_at", now)
+        pipe.hset(self._user_key(user_id), mapping=fields)
+        pipe.sadd(self.user_ids_key, user_id)
+        self._touch_user_queue(pipe, user_id)
+        pipe.execute()
+        return display_name
+
+    def get_all_users(self) -> List[Dict]:
+        user_ids = self.get_all_user_ids()
+        pipe = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.hgetall(self._user_key(user_id))
+        return [
+            self._user_dict(user_id, data)
+            for user_id, data in zip(user_ids, pipe.execute()) if data
+        ]
+
+    def get_all_user_ids(self) -> List[int]:
+        return [int(user_id) for user_id in self.client.smembers(self.user_ids_key)]
+
+    def update_user_display_name(self, user_id: int, new_display_name: str) -> bool:
+        if len(new_display_name.strip()) < 2:
+            return False
+        if not self.client.exists(self._user_key(user_id)):
+            return False
+        pipe = self.client.pipeline()
+        pipe.hset(self._user_key(user_id), mapping={
+            "display_name": new_display_name.strip(),
+            "last_seen_at": now_timestamp(),
+        })
+        self._touch_user_queue(pipe, user_id)
+        pipe.execute()
+        return True
+
+    def get_user_display_name(self, user_id: int) -> Optional[str]:
+        return self.client.hget(self._user_key(user_id), "display_name")
+
+    def get_user_full_info(self, user_id: int) -> Optional[Dict]:
+        data = self.client.hgetall(self._user_key(user_id))
+        return self._user_dict(user_id, data) if data else None
+
+    @staticmethod
+    def _user_dict(user_id, data: Dict) -> Dict:
+        fields = ("display_name", "username", "first_name", "last_name",
+                  "registered_at", "last_seen_at")
+        user = {"user_id": int(user_id)}
+        user.update({field: data.get(field) for field in fields})
+        for field in ("registered_at", "last_seen_at"):
+            if user[field] is not None:
+                user[field] = int(user[field])
+        return user
+
+    # ---------------- Очередь ----------------
+
+    def add_to_queue(self, user_id: int, name: str = None, office_id: str = DEFAULT_OFFICE) -> int:
+        if not name:
+            name = self.get_user_display_name(user_id) or f"User_{user_id}"
+        keys = self._keys(office_id)
+        position = int(self._join(
+            keys=[keys.queue, keys.joined, self.seq_key,
+                  self._user_key(user_id), self.user_ids_key, keys.version,
+                  keys.joined_sum, self.offices_key],
+            args=[user_id, name, now_timestamp(), office_id]
+        ))
+        if position > 0:
+            self._log_event(user_id, "joined", office_id)
+        return position
+
+    def remove_from_queue(self, user_id: int, reason: str = "left") -> Optional[int]:
+        office_id = self.get_user_office(user_id)
+        if office_id is None:
+            return None
+        removed = self._remove(keys=self._removal_keys(office_id), args=[user_id])
+        if not removed:
+            return None
+        position, joined_at = removed
+        self._log_event(user_id, reason, office_id, int(joined_at) if joined_at else None)
+        return int(position)
+
+    def get_queue(self, office_id: str = DEFAULT_OFFICE) -> List[Dict]:
+        return self._queue_entries(self.client.zrange(self._keys(office_id).queue, 0, -1), office_id)
+
+    def get_user_office(self, user_id: int) -> Optional[str]:
+        return self.client.hget(self.offices_key, user_id)
+
+    def get_user_position(self, user_id: int) -> Optional[int]:
+        office_id = self.get_user_office(user_id)
+        if office_id is None:
+            return None
+        rank = self.client.zrank(self._keys(office_id).queue, user_id)
+        return rank + 1 if rank is not None else None
+
+    def get_queue_length(self, office_id: str = DEFAULT_OFFICE) -> int:
+        return self.client.zcard(self._keys(office_id).queue)
+
+    def clear_queue(self, office_id: str = DEFAULT_OFFICE):
+        joined = self._clear(keys=self._removal_keys(office_id))
+        for user_id, joined_at in zip(joined[::2], joined[1::2]):
+            self._log_event(int(user_id), "cleared", office_id, int(joined_at))
+
+    def get_next_user(self, office_id: str = DEFAULT_OFFICE) -> Optional[Dict]:
+        popped = self._pop_head(keys=self._removal_keys(office_id))
+        if not popped:
+            return None
+        user_id, joined_at = popped
+        self._log_event(int(user_id), "accepted", office_id, int(joined_at))
+        return {
+            "user_id": int(user_id),
+            "name": self.get_user_display_name(user_id),
+            "joined_at": int(joined_at),
+        }
+
+    def serve_next(self, expected_user_id: Optional[int] = None,
+                   office_id: str = DEFAULT_OFFICE) -> Optional[Dict]:
+        popped = self._serve_next(
+            keys=self._removal_keys(office_id) + [self.system_key],
+            args=["" if expected_user_id is None else expected_user_id, serving_key(office_id)]
+        )
+        if not popped:
+            return None
+
+        user_id, joined_at, next_user_id = popped
+        served = {
+            "user_id": int(user_id),
+            "name": self.get_user_display_name(user_id),
+            "joined_at": int(joined_at),
+        }
+        self._log_event(served["user_id"], "accepted", office_id, served["joined_at"])
+        next_entries = self._queue_entries([next_user_id] if next_user_id else [], office_id)
+        return {"served": served, "next": next_entries[0] if next_entries else None}
+
+    def get_user_info(self, user_id: int) -> Optional[Dict]:
+        office_id = self.get_user_office(user_id)
+        if office_id is None or self.client.zscore(self._keys(office_id).queue, user_id) is None:
+            return None
+        entries = self._queue_entries([str(user_id)], office_id)
+        return entries[0] if entries else None
+
+    def search_user_by_name(self, search_term: str, office_id: str = DEFAULT_OFFICE) -> List[Dict]:
+        term = search_term.casefold()
+        return [
+            entry for entry in self.get_queue(office_id)
+            if entry["name"] and term in entry["name"].casefold()
+        ]
+
+    def get_queue_stats(self, office_id: str = DEFAULT_OFFICE) -> Dict:
+        keys = self._keys(office_id)
+        pipe = self.client.pipeline()
+        pipe.zcard(keys.queue)
+        pipe.get(keys.joined_sum)
+        pipe.zrange(keys.queue, 0, 1)
+        count, joined_sum, head_ids = pipe.execute()
+        return build_queue_stats(count, int(joined_sum or 0), self._queue_entries(head_ids, office_id))
+
+    def get_queue_page(self, after_seq: Optional[int] = None, before_seq: Optional[int] = None,
+                       start_user_id: Optional[int] = None, limit: int = 20,
+                       office_id: str = DEFAULT_OFFICE) -> Dict:
+        queue_key = self._keys(office_id).queue
+        if start_user_id is not None:
+            score = self.client.zscore(queue_key, start_user_id)
+            if score is not None:
+                after_seq = int(score) - 1
+
+        if before_seq is not None:
+            items = self.client.zrevrangebyscore(
+                queue_key, f"({before_seq}", "-inf", start=0, num=limit, withscores=True
+            )[::-1]
+        else:
+            items = self.client.zrangebyscore(
+                queue_key, f"({after_seq or 0}", "+inf", start=0, num=limit, withscores=True
+            )
+        if not items:
+            items = self.client.zrange(queue_key, 0, limit - 1, withscores=True)
+
+        total = self.client.zcard(queue_key)
+        entries = []
+        if items:
+            first_position = self.client.zrank(queue_key, items[0][0]) + 1
+            user_ids = [user_id for user_id, _ in items]
+            for offset, (entry, (_, seq)) in enumerate(zip(self._queue_entries(user_ids, office_id), items)):
+                entry["seq"] = int(seq)
+                entry["position"] = first_position + offset
+                entries.append(entry)
+
+        return {
+            "entries": entries,
+            "total": total,
+            "has_prev": bool(entries) and entries[0]["position"] > 1,
+            "has_next": bool(entries) and entries[-1]["position"] < total,
+        }
+
+    def get_queue_version(self, office_id: str = DEFAULT_OFFICE) -> int:
+        return int(self.client.get(self._keys(office_id).version) or 0)
+
+    def get_queue_snapshot(self, office_id: str = DEFAULT_OFFICE) -> Dict:
+        keys = self._keys(office_id)
+        pipe = self.client.pipeline()
+        pipe.get(keys.version)
+        pipe.zrange(keys.queue, 0, -1)
+        pipe.hgetall(keys.status)
+        version, user_ids, office_status = pipe.execute()
+        if office_status:
+            office_status["updated_at"] = int(office_status["updated_at"])
+        return {
+            "version": int(version or 0),
+            "queue": self._queue_entries(user_ids, office_id),
+            "office_status": office_status or self.get_office_status(office_id),
+        }
+
+    # ---------------- Уведомления о приближении очереди ----------------
+    def set_turn_notifications(self, user_id: int, enabled: bool) -> bool:
+        if not self.client.exists(self._user_key(user_id)):
+            return False
+        self.client.hset(self._user_key(user_id), "notify_turn", int(enabled))
+        return True
+
+    def get_turn_notifications(self, user_id: int) -> bool:
+        return self.client.hget(self._user_key(user_id), "notify_turn") == "1"
+
+    def get_turn_candidates(self, positions: List[int], office_id: str = DEFAULT_OFFICE) -> List[Dict]:
+        queue_key = self._keys(office_id).queue
+        pipe = self.client.pipeline(transaction=False)
+        for position in positions:
+            pipe.zrange(queue_key, position - 1, position - 1)
+        found = [(position, ids[0]) for position, ids in zip(positions, pipe.execute()) if ids]
+        if not found:
+            return []
+
+        pipe = self.client.pipeline(transaction=False)
+        for _, user_id in found:
+            pipe.hget(self._user_key(user_id), "notify_turn")
+        subscribed = [
+            (position, user_id)
+            for (position, user_id), notify in zip(found, pipe.execute()) if notify == "1"
+        ]
+
+        entries = self._queue_entries([user_id for _, user_id in subscribed], office_id)
+        for entry, (position, _) in zip(entries, subscribed):
+            entry["position"] = position
+        return entries
+
+    # ---------------- Статус кабинета ----------------
+    def set_office_status(self, status: str, message: str = "", office_id: str = DEFAULT_OFFICE):
+        keys = self._keys(office_id)
+        pipe = self.client.pipeline()
+        pipe.hset(keys.status, mapping={
+            "status": status,
+            "message": message,
+            "updated_at": now_timestamp(),
+        })
+        pipe.incr(keys.version)
+        pipe.execute()
+
+    def get_office_status(self, office_id: str = DEFAULT_OFFICE) -> Dict:
+        status = self.client.hgetall(self._keys(office_id).status)
+        if status:
+            status["updated_at"] = int(status["updated_at"])
+            return status
+        return {"status": "closed", "message": "", "updated_at": now_timestamp()}
+
+    # ---------------- Управление очередью ----------------
+    def get_first_user_in_queue(self, office_id: str = DEFAULT_OFFICE) -> Optional[Dict]:
+        entries = self._queue_entries(self.client.zrange(self._keys(office_id).queue, 0, 0), office_id)
+        return entries[0] if entries else None
+
+    def get_current_serving_user(self, office_id: str = DEFAULT_OFFICE) -> Optional[int]:
+        value = self.client.hget(self.system_key, serving_key(office_id))
+        return int(value) if value is not None else None
+
+    def set_current_serving_user(self, user_id: Optional[int], office_id: str = DEFAULT_OFFICE):
+        if user_id is None:
+            self.client.hdel(self.system_key, serving_key(office_id))
+        else:
+            self.client.hset(self.system_key, serving_key(office_id), user_id)
+
+    # ---------------- Системные значения ----------------
+    def get_system_value(self, key: str) -> Optional[str]:
+        return self.client.hget(self.system_key, key)
+
+    def set_system_value(self, key: str, value: Optional[str]):
+        if value is None:
+            self.client.hdel(self.system_key, key)
+        else:
+            self.client.hset(self.system_key, key, value)
+
+    def close(self):
+        self.flush_events()
+        self.client.close()
@@ -0,0 +1,233 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+# Максимальная длина текста одного сообщения Telegram
+MESSAGE_LIMIT = 4096
+# Имя в списке очереди обрезается до этой длины, чтобы любая строка помещалась в сообщение
+NAME_DISPLAY_LIMIT = 100
+
+STATUS_NAMES = {
+    "open": "✅ Открыт",
+    "closed": "❌ Закрыт"
+}
+
+
+class RenderCache:
+    """Готовые тексты сообщений по ключу (шаблон, версия очереди, ...).
+
+    Версия очереди меняется при каждом изменении, поэтому записи никогда
+    не устаревают — старые ключи просто перестают запрашиваться и
+    вытесняются по LRU.
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._items: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+
+def format_time(timestamp: int, fmt: str = "%H:%M") -> str:
+    """Метка времени хранилища (секунды unix-времени) в локальное время"""
+    return datetime.fromtimestamp(timestamp).strftime(fmt)
+
+
+def message_length(text: str) -> int:
+    """Длина текста так, как ее считает Telegram (в UTF-16), с запасом — вместе с HTML-тегами"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+# ---------------- Шаблоны ----------------
+
+def render_queue_page(page: Dict, status: Dict, viewer_id: Optional[int] = None,
+                      title: Optional[str] = None) -> str:
+    """Страница "Посмотреть очередь"; строка зрителя выделяется,
+    title — название кабинета, когда их несколько"""
+    entries = page["entries"]
+    text = f"🚪 <b>{title}</b>\n\n" if title else ""
+    if not entries:
+        text += "📭 <b>Очередь пуста</b>\n\n"
+    else:
+        lines = ["📋 <b>Текущая очередь:</b>\n"]
+        for entry in entries:
+            name = entry["name"]
+            if len(name) > NAME_DISPLAY_LIMIT:
+                name = name[:NAME_DISPLAY_LIMIT - 1] + "…"
+            line = f"{entry['position']}. {name}"
+            if entry["user_id"] == viewer_id:
+                line = f"👉 <b>{line}</b> (это ты)"
+            lines.append(line)
+        text += "\n".join(lines) + "\n"
+
+        if page["total"] > len(entries):
+            text += f"\n<i>Позиции {entries[0]['position']}–{entries[-1]['position']} из {page['total']}</i>\n"
+        text += f"\n<b>Всего в очереди:</b> {page['total']} человек(а)\n"
+
+    text += f"\n<b>Статус кабинета:</b> {STATUS_NAMES.get(status['status'], status['status'])}"
+
+    if status.get("message"):
+        text += f"\n{status['message']}"
+
+    return text
+
+
+def fit_queue_page(page: Dict, status: Dict, viewer_id: Optional[int] = None,
+                   title: Optional[str] = None, limit: int = MESSAGE_LIMIT) -> Tuple[str, Dict]:
+    """Страница очереди, которая помещается в одно сообщение.
+
+    Если текст длиннее limit, записи с конца страницы отбрасываются (до них
+    дойдут кнопкой ▶️). Возвращает текст и страницу с оставшимися записями.
+    """
+    text = render_queue_page(page, status, viewer_id, title)
+    while message_length(text) > limit and len(page["entries"]) > 1:
+        page = {**page, "entries": page["entries"][:-1], "has_next": True}
+        text = render_queue_page(page, status, viewer_id, title)
+    return text, page
+
+
+def render_management(queue: List[Dict], title: Optional[str] = None) -> str:
+    """Текст управления очередью (дашборд админа); title — название кабинета"""
+    header = f"👤 <b>Управление очередью{f': {title}' if title else ''}</b>\n\n"
+    if not queue:
+        return header + "📭 <i>Очередь пуста</i>"
+
+    first_user = queue[0]
+    first_user_name = first_user['name']
+
+    text = header
+    text += "<b>Первый в очереди:</b>\n"
+    text += f"✅ <b>{first_user_name}</b>\n"
+    text += f"🆔 ID: {first_user['user_id']}\n"
+    text += f"⏰ В очереди с: {format_time(first_user['joined_at'])}\n\n"
+
+    if len(queue) > 1:
+        text += f"<b>Ожидают:</b> {len(queue) - 1} человек(а)\n"
+        text += f"<b>Следующий:</b> {queue[1]['name']}\n"
+
+    return text
+
+
+def format_duration(seconds: float) -> str:
+    """Длительность словами: "45 мин.", "2 ч. 5 мин.", "3 дн. 4 ч." """
+    minutes = int(seconds // 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f"{days} дн. {hours} ч."
+    if hours:
+        return f"{hours} ч. {minutes} мин."
+    return f"{minutes} мин."
+
+
+def render_queue_stats(stats: Dict) -> str:
+    text = "<b>📊 Статистика очереди</b>\n\n"
+    text += f"<b>Всего в очереди:</b> {stats['count']} человек(а)\n"
+
+    if stats["count"]:
+        text += f"<b>Среднее время ожидания:</b> {format_duration(stats['average_wait'])}\n"
+        # Дольше всех ждет первый в очереди
+        text += f"<b>Дольше всех ждет:</b> {stats['first']['name']} ({format_duration(stats['longest_wait'])})\n"
+        if stats["next"]:
+            text += f"<b>Следующий:</b> {stats['next']['name']} ({format_duration(stats['next_wait'])})\n"
+        text += f"<b>Общее время ожидания:</b> {format_duration(stats['total_wait'])}\n"
+
+    return text
+
+
+EVENT_NAMES = {
+    "joined": "Встали в очередь",
+    "accepted": "Приняты",
+    "rejected": "Отклонены",
+    "left": "Вышли сами",
+    "cleared": "Сняты при очистке",
+}
+
+
+def render_queue_report(report: Dict) -> str:
+    """Отчет /report по журналу событий очереди"""
+    until = report["until"] - 1  # until не входит в период
+    text = (
+        f"<b>📈 Отчет по очереди</b>\n"
+        f"<i>{format_time(report['since'], '%Y-%m-%d')} — {format_time(until, '%Y-%m-%d')}</i>\n\n"
+    )
+    for event, name in EVENT_NAMES.items():
+        text += f"<b>{name}:</b> {report['counts'][event]}\n"
+
+    text += f"\n<b>Принято в час:</b> {report['served_per_hour']:.2f}\n"
+    text += f"<b>Доля отклоненных:</b> {report['rejection_rate']:.0%}\n"
+
+    percentiles = report["wait_percentiles"]
+    if percentiles:
+        text += "\n<b>Ожидание принятых:</b>\n"
+        text += "".join(f"• p{p}: {format_duration(wait)}\n" for p, wait in percentiles.items())
+
+    return text
+
+
+def format_eta(seconds: float) -> str:
+    """Прогноз ожидания: меньше минуты показываем как минуту"""
+    return f"~{format_duration(max(seconds, 60))}"
+
+
+def render_my_position(position: int, total_in_queue: int, eta: Optional[float] = None) -> str:
+    text = (
+        f"🔢 <b>Твой номер номер:</b> {position}\n"
+        f"👥 <b>Перед тобой:</b> {position - 1}\n"
+        f"📊 <b>Всего в очереди:</b> {total_in_queue}"
+    )
+    if eta is not None:
+        text += f"\n⏳ <b>Примерное ожидание:</b> {format_eta(eta)}"
+    return text
+
+
+def render_turn_coming(position: int) -> str:
+    """Уведомление подписавшемуся о приближении его очереди"""
+    if position == 1:
+        return "🔔 <b>Ты следующий!</b>\n\nПодходи к кабинету."
+    return (
+        f"🔔 <b>Скоро твоя очередь</b>\n\n"
+        f"• Твой номер: <b>{position}</b>\n"
+        f"• Перед тобой: <b>{position - 1}</b>"
+    )
+
+
+def render_join_notification(joins: List[Tuple[str, int]], head: List[Dict], total_in_queue: int) -> str:
+    """Уведомление админу о новых людях в очереди.
+
+    joins — (имя, позиция при записи), head — первые в очереди.
+    """
+    # Список первых 3 в очереди для информации
+    queue_info = ""
+    for user in head[:3]:
+        queue_info += f"{user['position']}. {user['name']}\n"
+
+    if total_in_queue > 3:
+        queue_info += f"... и еще {total_in_queue - 3}\n"
+
+    if len(joins) == 1:
+        user_name, position = joins[0]
+        text = (
+            f"👤 <b>Новый пользователь {user_name} в очереди, милорд!</b>\n\n"
+            f"• Его позиция: <b>{position}</b>\n"
+        )
+    else:
+        text = f"👥 <b>Новые в очереди, милорд: {len(joins)}</b>\n\n"
+        text += "".join(f"• {user_name} — <b>{position}</b>\n" for user_name, position in joins)
+        text += "\n"
+
+    return (
+        f"{text}"
+        f"• Всего в очереди: <b>{total_in_queue}</b>\n\n"
+        f"<b>Текущая очередь:</b>\n{queue_info}\n"
+    )
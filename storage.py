@@ -0,0 +1,289 @@
+import math
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import List, Optional, Dict, Union
+
+
+# Кабинет по умолчанию: в нем лежат очередь и статус, созданные до появления кабинетов
+DEFAULT_OFFICE = "main"
+
+
+def serving_key(office_id: str) -> str:
+    """Ключ current_serving кабинета в системных значениях"""
+    return "current_serving" if office_id == DEFAULT_OFFICE else f"current_serving:{office_id}"
+
+
+def build_display_name(user_id: int, username: str = None,
+                       first_name: str = None, last_name: str = None) -> str:
+    """Сформировать display_name из данных Telegram"""
+    display_name = first_name or ""
+    if last_name:
+        if display_name:
+            display_name += f" {last_name}"
+        else:
+            display_name = last_name
+
+    # Если нет имени и фамилии, используем username
+    if not display_name or display_name.strip() == "":
+        if username:
+            display_name = f"@{username}"
+        else:
+            display_name = f"User_{user_id}"
+
+    return display_name
+
+
+def now_timestamp() -> int:
+    """Текущее время в секундах unix-времени — так хранятся все метки времени"""
+    return int(time.time())
+
+
+def iso_to_timestamp(value: Union[str, int, None]) -> Optional[int]:
+    """Метка времени старого формата (локальная ISO-строка) в unix-время"""
+    if value is None or isinstance(value, int):
+        return value
+    if value.isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(value).timestamp())
+
+
+def build_queue_stats(count: int, joined_sum: int, head: List[Dict]) -> Dict:
+    """Статистика очереди по счетчикам: сумма ожиданий = count * now - сумма времен записи"""
+    now = now_timestamp()
+    first_user = head[0] if head else None
+    next_user = head[1] if len(head) > 1 else None
+    total_wait = max(0, count * now - joined_sum)
+    return {
+        "count": count,
+        "total_wait": total_wait,  # секунды
+        "average_wait": total_wait / count if count else 0,
+        "longest_wait": max(0, now - first_user["joined_at"]) if first_user else 0,
+        "first": first_user,
+        "next": next_user,
+        "next_wait": max(0, now - next_user["joined_at"]) if next_user else 0,
+    }
+
+
+# События журнала очереди
+QUEUE_EVENTS = ("joined", "accepted", "rejected", "left", "cleared")
+
+
+def percentile(sorted_values: List[int], fraction: float) -> Optional[int]:
+    """Перцентиль методом ближайшего ранга для уже отсортированного списка"""
+    if not sorted_values:
+        return None
+    # round убирает погрешность float: 0.07 * 100 = 7.000000000000001
+    index = max(0, math.ceil(round(fraction * len(sorted_values), 9)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def build_queue_report(since: int, until: int, counts: Dict[str, int], waits: List[int]) -> Dict:
+    """Отчет за [since, until): counts — события по типам, waits — ожидания принятых (отсортированы).
+
+    Приемы в час считаются только по прошедшей части периода: отчет за
+    сегодня в 10:00 делится на 10 часов, а не на 24.
+    """
+    hours = max(min(until, now_timestamp()) - since, 1) / 3600
+    accepted = counts.get("accepted", 0)
+    rejected = counts.get("rejected", 0)
+    decided = accepted + rejected
+    return {
+        "since": since,
+        "until": until,
+        "counts": {event: counts.get(event, 0) for event in QUEUE_EVENTS},
+        "served_per_hour": accepted / hours,
+        "rejection_rate": rejected / decided if decided else 0,
+        "wait_percentiles": {
+            p: percentile(waits, p / 100) for p in (50, 90, 95)
+        } if waits else {},
+    }
+
+
+class QueueStorage(ABC):
+    """Интерфейс хранилища очереди.
+
+    Реализации: QueueDB (SQLite, database.py) и RedisQueueDB
+    (redis_storage.py). Бот работает только с этим набором методов,
+    поэтому хранилище выбирается настройкой STORAGE_BACKEND.
+
+    Все метки времени (joined_at, registered_at, last_seen_at, updated_at) —
+    целые секунды unix-времени.
+
+    Очередей несколько — по одной на кабинет (office_id). Методы очереди и
+    статуса принимают office_id (по умолчанию DEFAULT_OFFICE); методы,
+    которым передается user_id стоящего в очереди, сами находят его
+    кабинет: человек стоит не больше чем в одной очереди.
+    """
+
+    # ---------------- Пользователи ----------------
+    @abstractmethod
+    def add_or_update_user(self, user_id: int, username: str = None,
+                           first_name: str = None, last_name: str = None) -> str:
+        """Добавить или обновить пользователя, возвращает display_name"""
+
+    @abstractmethod
+    def get_all_users(self) -> List[Dict]:
+        """Получить всех пользователей бота"""
+
+    @abstractmethod
+    def get_all_user_ids(self) -> List[int]:
+        """Получить только ID всех пользователей"""
+
+    @abstractmethod
+    def update_user_display_name(self, user_id: int, new_display_name: str) -> bool:
+        """Изменить отображаемое имя пользователя"""
+
+    @abstractmethod
+    def get_user_display_name(self, user_id: int) -> Optional[str]:
+        """Получить отображаемое имя пользователя"""
+
+    @abstractmethod
+    def get_user_full_info(self, user_id: int) -> Optional[Dict]:
+        """Получить полную информацию о пользователе"""
+
+    # ---------------- Очередь ----------------
+    @abstractmethod
+    def add_to_queue(self, user_id: int, name: str = None, office_id: str = DEFAULT_OFFICE) -> int:
+        """Добавить пользователя в очередь кабинета, вернуть его позицию
+        (-1, если он уже стоит в какой-либо очереди)"""
+
+    @abstractmethod
+    def remove_from_queue(self, user_id: int, reason: str = "left") -> Optional[int]:
+        """Удалить пользователя из очереди, вернуть позицию, которую он занимал
+        (None, если его не было); reason — событие журнала (left/rejected)"""
+
+    @abstractmethod
+    def get_queue(self, office_id: str = DEFAULT_OFFICE) -> List[Dict]:
+        """Получить всю очередь в порядке добавления с именами пользователей"""
+
+    @abstractmethod
+    def get_user_office(self, user_id: int) -> Optional[str]:
+        """Кабинет, в очереди которого стоит пользователь, или None"""
+
+    @abstractmethod
+    def get_user_position(self, user_id: int) -> Optional[int]:
+        """Получить позицию пользователя в его очереди (1 = первый)"""
+
+    @abstractmethod
+    def get_queue_length(self, office_id: str = DEFAULT_OFFICE) -> int:
+        """Количество людей в очереди"""
+
+    @abstractmethod
+    def clear_queue(self, office_id: str = DEFAULT_OFFICE):
+        """Очистить всю очередь"""
+
+    @abstractmethod
+    def get_next_user(self, office_id: str = DEFAULT_OFFICE) -> Optional[Dict]:
+        """Получить следующего пользователя и удалить его из очереди"""
+
+    @abstractmethod
+    def serve_next(self, expected_user_id: Optional[int] = None,
+                   office_id: str = DEFAULT_OFFICE) -> Optional[Dict]:
+        """Принять первого в очереди одной атомарной операцией.
+
+        Снимает первого, записывает его в current_serving и возвращает
+        {"served", "next"} (next — новый первый или None). С expected_user_id
+        снимает первого, только если это он; иначе и при пустой очереди — None.
+        """
+
+    @abstractmethod
+    def get_user_info(self, user_id: int) -> Optional[Dict]:
+        """Получить информацию о пользователе в очереди"""
+
+    @abstractmethod
+    def search_user_by_name(self, search_term: str, office_id: str = DEFAULT_OFFICE) -> List[Dict]:
+        """Поиск пользователя в очереди по имени (частичному совпадению)"""
+
+    @abstractmethod
+    def get_queue_stats(self, office_id: str = DEFAULT_OFFICE) -> Dict:
+        """Статистика за O(1): count, total_wait, average_wait, longest_wait
+        (в секундах), first и next — первые двое в очереди"""
+
+    @abstractmethod
+    def get_queue_page(self, after_seq: Optional[int] = None, before_seq: Optional[int] = None,
+                       start_user_id: Optional[int] = None, limit: int = 20,
+                       office_id: str = DEFAULT_OFFICE) -> Dict:
+        """Страница очереди по ключу seq (без OFFSET).
+
+        after_seq — следующая страница, before_seq — предыдущая,
+        start_user_id — страница, начинающаяся с этого пользователя;
+        без параметров — первая страница. Возвращает {"entries", "total",
+        "has_prev", "has_next"}, у записей есть поля seq и position.
+        """
+
+    @abstractmethod
+    def get_queue_version(self, office_id: str = DEFAULT_OFFICE) -> int:
+        """Версия очереди: меняется при каждом изменении очереди или статуса"""
+
+    @abstractmethod
+    def get_queue_snapshot(self, office_id: str = DEFAULT_OFFICE) -> Dict:
+        """Снимок {"version", "queue", "office_status"} для отрисовки"""
+
+    # ---------------- Уведомления о приближении очереди ----------------
+    @abstractmethod
+    def set_turn_notifications(self, user_id: int, enabled: bool) -> bool:
+        """Включить или выключить уведомления; False, если пользователь неизвестен"""
+
+    @abstractmethod
+    def get_turn_notifications(self, user_id: int) -> bool:
+        """Включены ли у пользователя уведомления о приближении очереди"""
+
+    @abstractmethod
+    def get_turn_candidates(self, positions: List[int], office_id: str = DEFAULT_OFFICE) -> List[Dict]:
+        """Записи очереди, стоящие ровно на позициях positions, у тех, кто
+        включил уведомления. Поиск по позиции, без обхода очереди"""
+
+    # ---------------- Статус кабинета ----------------
+    @abstractmethod
+    def set_office_status(self, status: str, message: str = "", office_id: str = DEFAULT_OFFICE):
+        """Установить статус кабинета (open/closed/paused)"""
+
+    @abstractmethod
+    def get_office_status(self, office_id: str = DEFAULT_OFFICE) -> Dict:
+        """Получить статус кабинета"""
+
+    # ---------------- Управление очередью ----------------
+    @abstractmethod
+    def get_first_user_in_queue(self, office_id: str = DEFAULT_OFFICE) -> Optional[Dict]:
+        """Получить первого пользователя в очереди (без удаления)"""
+
+    @abstractmethod
+    def get_current_serving_user(self, office_id: str = DEFAULT_OFFICE) -> Optional[int]:
+        """Получить ID пользователя, которого сейчас принимают (если есть)"""
+
+    @abstractmethod
+    def set_current_serving_user(self, user_id: Optional[int], office_id: str = DEFAULT_OFFICE):
+        """Установить ID пользователя, которого сейчас принимают"""
+
+    # ---------------- Журнал событий ----------------
+    @abstractmethod
+    def get_queue_report(self, since: int, until: int, office_id: Optional[str] = None) -> Dict:
+        """Отчет по журналу событий за [since, until) (секунды unix-времени)
+        по кабинету office_id или по всем (None): counts, served_per_hour,
+        rejection_rate, wait_percentiles"""
+
+    def flush_events(self) -> int:
+        """Записать накопленные события журнала, вернуть их количество"""
+        return 0
+
+    # ---------------- Системные значения ----------------
+    @abstractmethod
+    def get_system_value(self, key: str) -> Optional[str]:
+        """Получить значение из таблицы system"""
+
+    @abstractmethod
+    def set_system_value(self, key: str, value: Optional[str]):
+        """Записать значение в таблицу system (None — удалить)"""
+
+    def flush_user_updates(self) -> int:
+        """Записать отложенные обновления пользователей, вернуть их количество"""
+        return 0
+
+    def is_user_being_served(self, user_id: int, office_id: str = DEFAULT_OFFICE) -> bool:
+        """Проверяет, обслуживается ли пользователь сейчас"""
+        return self.get_current_serving_user(office_id) == user_id
+
+    @abstractmethod
+    def close(self):
+        """Освободить соединения хранилища"""
@@ -0,0 +1,48 @@
+import asyncio
+import traceback
+from typing import Awaitable, Callable, Optional, Set
+
+
+class TaskRunner:
+    """Фоновые задачи бота.
+
+    Обработчик запускает задачу и сразу возвращается, поэтому уведомления
+    и обновления не задерживают следующее действие админа. Задачи
+    отслеживаются: исключение печатается с именем задачи, а при остановке
+    бота все незавершенные задачи отменяются.
+    """
+
+    def __init__(self):
+        self._tasks: Set[asyncio.Task] = set()
+
+    def spawn(self, coro: Awaitable, name: Optional[str] = None) -> asyncio.Task:
+        """Запустить корутину в фоне"""
+        task = asyncio.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+        return task
+
+    def schedule(self, delay: float, func: Callable[[], Awaitable],
+                 name: Optional[str] = None) -> asyncio.Task:
+        """Выполнить func() через delay секунд; задачу можно отменить"""
+        async def delayed():
+            await asyncio.sleep(delay)
+            await func()
+
+        return self.spawn(delayed(), name=name)
+
+    def _done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            print(f"Ошибка в фоновой задаче {task.get_name()}: {error!r}")
+            traceback.print_exception(type(error), error, error.__traceback__)
+
+    async def close(self):
+        """Отменить незавершенные задачи"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,70 @@
+import inspect
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from aiogram.filters import Filter
+from aiogram.types import Message
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+class TextCommands(Filter):
+    """Кнопки reply-клавиатуры: текст кнопки -> обработчик.
+
+    Вместо отдельного F.text == "..." на каждую кнопку aiogram проверяет
+    один фильтр, а он находит обработчик одним поиском в словаре. По
+    началу текста ищутся только кнопки с переменной частью (старые
+    "✅ Принять <имя>"), и только если точного совпадения нет.
+    Повторная регистрация текста — ошибка при запуске бота.
+    """
+
+    def __init__(self):
+        self._exact: Dict[str, Tuple[Handler, bool]] = {}
+        self._prefixes: List[Tuple[str, Handler, bool]] = []
+
+    def button(self, text: str):
+        """Декоратор: обработчик кнопки с текстом text"""
+        def register(handler: Handler) -> Handler:
+            if text in self._exact:
+                raise ValueError(f"Кнопка '{text}' уже обрабатывается в {self._exact[text][0].__name__}")
+            self._exact[text] = (handler, self._wants_state(handler))
+            return handler
+        return register
+
+    def prefix(self, prefix: str):
+        """Декоратор: обработчик кнопок, текст которых начинается с prefix"""
+        def register(handler: Handler) -> Handler:
+            for registered, other, _ in self._prefixes:
+                if registered.startswith(prefix) or prefix.startswith(registered):
+                    raise ValueError(f"Префикс '{prefix}' пересекается с '{registered}' ({other.__name__})")
+            self._prefixes.append((prefix, handler, self._wants_state(handler)))
+            return handler
+        return register
+
+    @staticmethod
+    def _wants_state(handler: Handler) -> bool:
+        return "state" in inspect.signature(handler).parameters
+
+    def resolve(self, text: Optional[str]) -> Optional[Tuple[Handler, bool]]:
+        if text is None:
+            return None
+        found = self._exact.get(text)
+        if found is not None:
+            return found
+        for prefix, handler, wants_state in self._prefixes:
+            if text.startswith(prefix):
+                return handler, wants_state
+        return None
+
+    async def __call__(self, message: Message) -> Union[bool, Dict[str, Any]]:
+        found = self.resolve(message.text)
+        if found is None:
+            return False
+        return {"text_command": found}
+
+    @staticmethod
+    async def dispatch(message: Message, text_command: Tuple[Handler, bool], state=None):
+        """Единственный обработчик aiogram для всех кнопок"""
+        handler, wants_state = text_command
+        if wants_state:
+            return await handler(message, state=state)
+        return await handler(message)
@@ -0,0 +1,96 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "warned")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+        self.warned = False
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Защита от частых нажатий: ведро токенов на каждого пользователя.
+
+    В ведре до burst токенов, они пополняются со скоростью rate в секунду;
+    каждое сообщение или нажатие inline-кнопки тратит токен. Если токенов
+    нет, событие отбрасывается до обработчиков и базы: на нажатие кнопки
+    отвечаем коротким всплывающим текстом, на сообщение — одним
+    предупреждением, пока пользователь не притормозит. У админов свои,
+    более высокие лимиты; rate = 0 — без ограничения.
+
+    Ведра лежат в памяти в порядке последнего обращения. Ведро, которое
+    не трогали дольше времени полного пополнения, ничем не отличается от
+    нового, поэтому такие удаляются с начала списка; сверх max_users
+    удаляются самые давние.
+    """
+
+    def __init__(self, rate: float, burst: float, admin_rate: float, admin_burst: float,
+                 is_admin: Callable[[int], bool], max_users: int = 10000):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.admin_rate = admin_rate
+        self.admin_burst = max(admin_burst, 1)
+        self.is_admin = is_admin
+        self.max_users = max(max_users, 1)
+        self._buckets: "OrderedDict[int, _Bucket]" = OrderedDict()
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        if self.is_admin(user.id):
+            rate, burst = self.admin_rate, self.admin_burst
+        else:
+            rate, burst = self.rate, self.burst
+        if rate <= 0:
+            return await handler(event, data)
+
+        bucket = self._take(user.id, rate, burst, time.monotonic())
+        if bucket is None:
+            return await handler(event, data)
+
+        try:
+            if isinstance(event, CallbackQuery):
+                await event.answer("⏳ Не так быстро")
+            elif isinstance(event, Message) and not bucket.warned:
+                bucket.warned = True
+                await event.answer("⏳ <b>Не так быстро!</b> Подожди пару секунд.", parse_mode="HTML")
+        except Exception as e:
+            print(f"Не удалось ответить на частые нажатия пользователя {user.id}: {e}")
+        return None
+
+    def _take(self, user_id: int, rate: float, burst: float, now: float):
+        """Потратить токен; None — можно обрабатывать, иначе ведро без токенов"""
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = _Bucket(burst, now)
+            self._evict(now)
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.warned = False
+            return None
+        return bucket
+
+    def _evict(self, now: float):
+        # Время, за которое пустое ведро наполняется до краев — с любыми лимитами
+        idle = max(burst / rate for rate, burst in
+                   ((self.rate, self.burst), (self.admin_rate, self.admin_burst)) if rate > 0)
+        while self._buckets:
+            bucket = next(iter(self._buckets.values()))
+            if len(self._buckets) <= self.max_users and now - bucket.updated < idle:
+                break
+            self._buckets.popitem(last=False)
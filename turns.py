@@ -0,0 +1,65 @@
+import asyncio
+from typing import Dict, Iterable, List, Optional
+
+from aiogram import Bot
+
+import render
+from storage import DEFAULT_OFFICE
+from tasks import TaskRunner
+
+
+def parse_positions(value: str) -> List[int]:
+    """Позиции для уведомлений из строки вида "3,1", по возрастанию"""
+    positions = {int(part) for part in value.split(",") if part.strip().isdigit()}
+    return sorted(position for position in positions if position > 0)
+
+
+class TurnNotifier:
+    """Уведомления "твоя очередь скоро" для подписавшихся пользователей.
+
+    Когда из очереди уходит человек с позиции p, все, кто стоял за ним,
+    сдвигаются на одну позицию вперед. Порог T пересек только тот, кто
+    теперь стоит ровно на T, и только если T >= p, поэтому после удаления
+    проверяются лишь эти позиции, а не вся очередь.
+
+    Кому и о каком пороге уже написали, запоминается: при одновременных
+    удалениях один человек не получит одно уведомление дважды. Человек
+    стоит только в одной очереди, поэтому память общая для всех кабинетов.
+    """
+
+    def __init__(self, bot: Bot, tasks: TaskRunner, db, positions: Iterable[int]):
+        self.bot = bot
+        self.tasks = tasks
+        self.db = db
+        self.positions = sorted(positions)
+        self._notified: Dict[int, int] = {}  # user_id -> наименьший порог, о котором написали
+        self._lock = asyncio.Lock()
+
+    def removed(self, user_id: int, position: Optional[int], office_id: str = DEFAULT_OFFICE):
+        """Человек ушел из очереди кабинета с позиции position (вызывать после удаления)"""
+        self._notified.pop(user_id, None)
+        if position is None:
+            return
+        thresholds = [threshold for threshold in self.positions if threshold >= position]
+        if thresholds:
+            self.tasks.spawn(self._check(thresholds, office_id), name="turn_notify")
+
+    def cleared(self, user_ids: Iterable[int]):
+        """Очередь очищена: user_ids — кто в ней стоял"""
+        for user_id in user_ids:
+            self._notified.pop(user_id, None)
+
+    async def _check(self, thresholds: List[int], office_id: str):
+        async with self._lock:
+            for entry in await self.db.get_turn_candidates(thresholds, office_id):
+                user_id, position = entry["user_id"], entry["position"]
+                if self._notified.get(user_id, position + 1) <= position:
+                    continue
+                self._notified[user_id] = position
+                self.tasks.spawn(self._send(user_id, render.render_turn_coming(position)))
+
+    async def _send(self, user_id: int, text: str):
+        try:
+            await self.bot.send_message(user_id, text, parse_mode="HTML")
+        except Exception as e:
+            print(f"Не удалось уведомить пользователя {user_id} о приближении очереди: {e}")